@@ -0,0 +1,220 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+from PIL import Image
+from config import AMOUNT, IMAGES, OUTPUT_FORMAT, OutputFormat
+from generate import (
+    tables,
+    plan_unique_attr,
+    find_layer_path,
+    read_plan,
+    sort_by_layers,
+    token_layers,
+)
+from render import composite, PrefixCompositor, prefix_savings
+from writer import encode_image
+
+
+def sample_images(n: int) -> list[Image.Image]:
+    """
+    render n rule-valid combinations in memory, nothing is written to disk
+
+    Args:
+        n (int): amount of images
+
+    Returns:
+        list[Image.Image]: RGB images
+    """
+    props, sampler = tables()["props"], tables()["sampler"]
+    folder_idx, codes = plan_unique_attr(n)
+    images = []
+    for folder_index, row in zip(folder_idx, codes):
+        folder = sampler.folders[folder_index]
+        paths = [
+            find_layer_path(folder, prop, sampler.values[p][row[p]])
+            for p, prop in enumerate(props)
+        ]
+        images.append(composite(paths))
+    return images
+
+
+def benchmark_codecs(
+    images: list[Image.Image], output_formats: list[str], amount: int = AMOUNT
+) -> list[dict]:
+    """
+    encode the same images with every output format
+
+    Args:
+        images (list[Image.Image]): sample images
+        output_formats (list[str]): OutputFormat values to compare
+        amount (int, optional): collection size used to project upload size. Defaults to AMOUNT.
+
+    Returns:
+        list[dict]: one result per format, with encode ms per image, average kB and projected total MB
+    """
+    results = []
+    for output_format in output_formats:
+        start = time.perf_counter()
+        sizes = [len(encode_image(img, output_format)) for img in images]
+        seconds = time.perf_counter() - start
+        average = sum(sizes) / len(sizes)
+        results.append(
+            {
+                "format": output_format,
+                "encode_ms": seconds / len(images) * 1000,
+                "average_kb": average / 1024,
+                "total_mb": average * amount / 1024**2,
+            }
+        )
+    return results
+
+
+def print_codec_results(results: list[dict]):
+    """
+    print a table of benchmark_codecs results
+
+    Args:
+        results (list[dict]): results of benchmark_codecs
+    """
+    print(f"{'format':<16}{'encode ms':>12}{'average kB':>12}{'total MB':>12}")
+    for r in results:
+        mark = " *" if r["format"] == OUTPUT_FORMAT else ""
+        print(
+            f"{r['format']:<16}{r['encode_ms']:>12.1f}{r['average_kb']:>12.1f}{r['total_mb']:>12.1f}{mark}"
+        )
+
+
+STARTUP_MODULES = ["upload", "upload_mystery_box", "final_check", "generate"]
+HEAVY_MODULES = [
+    "pandas",
+    "numpy",
+    "httpx",
+    "PIL",
+]  # reported when an import pulls them in
+IMPORT_PROBE = """
+import sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+heavy = [m for m in {heavy} if m in sys.modules]
+print(seconds, ",".join(heavy))
+"""
+
+
+def benchmark_startup(modules: list[str], repeat: int = 5) -> list[dict]:
+    """
+    time importing each module in a fresh interpreter, the fastest of repeat runs is kept
+
+    Args:
+        modules (list[str]): module names in src
+        repeat (int, optional): interpreters started per module. Defaults to 5.
+
+    Returns:
+        list[dict]: one result per module, with import ms and the heavy modules it loaded
+    """
+    env = os.environ | {"PYTHONPATH": os.path.dirname(os.path.abspath(__file__))}
+    results = []
+    for module in modules:
+        code = IMPORT_PROBE.format(module=module, heavy=HEAVY_MODULES)
+        runs = []
+        for _ in range(repeat):
+            out = subprocess.run(
+                [sys.executable, "-c", code],
+                env=env,
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout.split()
+            runs.append(float(out[0]))
+        results.append(
+            {
+                "module": module,
+                "import_ms": min(runs) * 1000,
+                "heavy": out[1] if len(out) > 1 else "",
+            }
+        )
+    return results
+
+
+def print_startup_results(results: list[dict]):
+    """
+    print a table of benchmark_startup results
+
+    Args:
+        results (list[dict]): results of benchmark_startup
+    """
+    print(f"{'module':<20}{'import ms':>12}  heavy imports")
+    for r in results:
+        print(f"{r['module']:<20}{r['import_ms']:>12.1f}  {r['heavy'] or '-'}")
+
+
+def benchmark_prefix(attr_path: str) -> dict:
+    """
+    count the blends the prefix cache saves on the tokens of an attr.csv, nothing is rendered
+
+    Args:
+        attr_path (str): attr.csv or plan.csv path
+
+    Returns:
+        dict: tokens, naive and saved blends in render order, and frames kept by PREFIX_CACHE_MB
+    """
+    df_attr = sort_by_layers(read_plan(attr_path))
+    stacks = [tuple(paths) for paths in token_layers(df_attr) if paths is not None]
+    max_depth = PrefixCompositor().max_depth
+    naive, saved = prefix_savings(stacks, max_depth)
+    return {"tokens": len(stacks), "naive": naive, "saved": saved, "depth": max_depth}
+
+
+def print_prefix_results(result: dict):
+    """
+    print benchmark_prefix results
+
+    Args:
+        result (dict): result of benchmark_prefix
+    """
+    share = result["saved"] / max(result["naive"], 1)
+    print(
+        f"{result['tokens']} tokens, prefix cache of {result['depth']} frames saves "
+        f"{result['saved']} of {result['naive']} blends ({share:.0%})"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmark the generation pipeline")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    codecs_parser = subparsers.add_parser(
+        "codecs", help="compare encode time and file size of output formats"
+    )
+    codecs_parser.add_argument(
+        "--samples", type=int, default=20, help="images rendered for the comparison"
+    )
+    startup_parser = subparsers.add_parser(
+        "startup", help="time importing entry modules in a fresh interpreter"
+    )
+    startup_parser.add_argument(
+        "modules", nargs="*", default=STARTUP_MODULES, help="modules to import"
+    )
+    startup_parser.add_argument(
+        "--repeat", type=int, default=5, help="interpreters started per module"
+    )
+    prefix_parser = subparsers.add_parser(
+        "prefix", help="count blends the prefix cache saves, without rendering"
+    )
+    prefix_parser.add_argument(
+        "--csv",
+        default=os.path.join(IMAGES, "attr.csv"),
+        help="attr.csv or plan.csv to count",
+    )
+    args = parser.parse_args()
+    if args.command == "prefix":
+        print_prefix_results(benchmark_prefix(args.csv))
+    if args.command == "startup":
+        print_startup_results(benchmark_startup(args.modules, args.repeat))
+    if args.command == "codecs":
+        images = sample_images(min(args.samples, AMOUNT))
+        print(f"{len(images)} sample images, total size projected for {AMOUNT} images")
+        print_codec_results(
+            benchmark_codecs(images, [f.value for f in OutputFormat], AMOUNT)
+        )
@@ -0,0 +1,459 @@
+import itertools
+import numpy as np
+from sampler import CompiledSampler
+from rules import CompiledRules
+
+OTHER = -1  # code of values no rule mentions, they are interchangeable for counting
+
+
+def rule_components(rules: CompiledRules) -> tuple[list[list[int]], list[set[int]]]:
+    """
+    group props linked by rules, groups are independent of each other
+
+    Args:
+        rules (CompiledRules): compiled rules
+
+    Returns:
+        tuple[list[list[int]], list[set[int]]]: (prop indexes of each group, codes mentioned by rules of each prop)
+    """
+    n_props = len(rules.sampler.props)
+    slot_prop = np.repeat(
+        np.arange(n_props), [len(values) for values in rules.sampler.values]
+    )
+    parent = list(range(n_props))
+
+    def find(p: int) -> int:
+        while parent[p] != p:
+            p = parent[p]
+        return p
+
+    mentioned: list[set[int]] = [set() for _ in range(n_props)]
+    links = []
+    for a, b in zip(*np.nonzero(rules.conflict)):
+        links.append((int(slot_prop[a]), int(slot_prop[b])))
+        mentioned[slot_prop[a]].add(int(a - rules.offsets[slot_prop[a]]))
+    for prop, code, targets in rules.requires:
+        mentioned[prop].add(code)
+        for target_prop, target_codes in targets:
+            links.append((prop, target_prop))
+            mentioned[target_prop].update(int(c) for c in target_codes)
+    for a, b in links:
+        parent[find(a)] = find(b)
+    groups: dict[int, list[int]] = {}
+    for p in range(n_props):
+        groups.setdefault(find(p), []).append(p)
+    return list(groups.values()), mentioned
+
+
+def count_component(
+    rules: CompiledRules,
+    folder_index: int,
+    props: list[int],
+    mentioned: list[set[int]],
+    max_states: int,
+) -> dict | None:
+    """
+    exact distribution of the rule-valid outputs of a group of props in a folder.
+    Values no rule mentions collapse to OTHER, so only mentioned values are enumerated
+
+    Args:
+        rules (CompiledRules): compiled rules
+        folder_index (int): index of folder in folders
+        props (list[int]): prop indexes of the group
+        mentioned (list[set[int]]): codes mentioned by rules of each prop
+        max_states (int): give up when the group has more candidates than this
+
+    Returns:
+        dict | None: outputs (k, props) with OTHER cells, their probs given the group is valid,
+            accept probability, combinations, sum of squared probs and OTHER values per prop, None if too large
+    """
+    sampler = rules.sampler
+    domains, other_codes, other_probs = [], [], []
+    for p in props:
+        codes, weights = (
+            sampler.codes[folder_index][p],
+            sampler.weights[folder_index][p],
+        )
+        domain = [
+            (int(c), float(w))
+            for c, w in zip(codes, weights)
+            if c in mentioned[p] and w > 0
+        ]
+        other = (weights > 0) & ~np.isin(codes, list(mentioned[p]))
+        other_codes.append(codes[other])
+        other_weight = float(weights[other].sum())
+        other_probs.append(
+            weights[other] / other_weight if other_weight > 0 else weights[other]
+        )
+        if other_weight > 0:
+            domain.append((OTHER, other_weight))
+        domains.append(domain)
+    if np.prod([len(d) for d in domains], dtype=float) > max_states:
+        return None
+
+    position = {p: i for i, p in enumerate(props)}
+    requires = [
+        (position[prop], code, [(position[t], c) for t, c in targets])
+        for prop, code, targets in rules.requires
+        if prop in position
+    ]
+    outputs: dict[tuple[int, ...], float] = {}
+    for drawn in itertools.product(*domains):
+        source = tuple(code for code, _ in drawn)
+        prob = float(np.prod([w for _, w in drawn]))
+        branches = [(list(source), prob)]
+        for prop, code, targets in requires:
+            next_branches = []
+            for codes, branch_prob in branches:
+                if codes[prop] != code:
+                    next_branches.append((codes, branch_prob))
+                    continue
+                options = [[]]
+                for target, target_codes in targets:
+                    options = [
+                        o + [(target, int(c))] for o in options for c in target_codes
+                    ]
+                for option in options:
+                    forced = list(codes)
+                    for target, c in option:
+                        forced[target] = c
+                    next_branches.append((forced, branch_prob / len(options)))
+            branches = next_branches
+        for codes, branch_prob in branches:
+            if valid_output(rules, folder_index, props, source, codes):
+                key = tuple(codes)
+                outputs[key] = outputs.get(key, 0.0) + branch_prob
+
+    keys = list(outputs)
+    out = np.array(keys, dtype=np.int64).reshape(len(keys), len(props))
+    probs = np.array([outputs[k] for k in keys])
+    accept = float(probs.sum())
+    if accept > 0:
+        probs = probs / accept
+    is_other = out == OTHER
+    n_other = np.array([len(c) for c in other_codes], dtype=float)
+    sq_other = np.array([float((o**2).sum()) for o in other_probs])
+    return {
+        "props": props,
+        "outputs": out,
+        "probs": probs,
+        "accept": accept,
+        "combinations": int(np.where(is_other, n_other, 1).prod(axis=1).sum()),
+        "sum_sq": float(
+            (probs**2 * np.where(is_other, sq_other, 1).prod(axis=1)).sum()
+        ),
+        "other_codes": other_codes,
+        "other_probs": other_probs,
+    }
+
+
+def valid_output(
+    rules: CompiledRules,
+    folder_index: int,
+    props: list[int],
+    source: tuple[int, ...],
+    codes: list[int],
+) -> bool:
+    """
+    same checks as CompiledRules.apply on a group, OTHER values never conflict
+
+    Args:
+        rules (CompiledRules): compiled rules
+        folder_index (int): index of folder in folders
+        props (list[int]): prop indexes of the group
+        source (tuple[int, ...]): drawn codes
+        codes (list[int]): codes after requirements
+
+    Returns:
+        bool: True if the output is accepted
+    """
+    slots = [rules.offsets[p] + c for p, c in zip(props, codes) if c != OTHER]
+    if rules.conflict[np.ix_(slots, slots)].any():
+        return False
+    return all(
+        rules.available[folder_index, rules.offsets[p] + c]
+        for p, c, s in zip(props, codes, source)
+        if c != s
+    )
+
+
+def analyze_capacity(
+    sampler: CompiledSampler,
+    rules: CompiledRules,
+    amount: int,
+    samples: int = 20000,
+    max_states: int = 1000000,
+    rng: np.random.Generator | None = None,
+) -> dict:
+    """
+    count rule-valid unique combinations exactly and estimate the sampling work of a plan.
+    Combinations are counted per group of props linked by rules and multiplied,
+    the draws needed for amount unique images are the coupon collector time t where
+    E[unique after t draws] = sum(1 - exp(-p * t)) reaches amount, estimated on samples
+    of the exact rejection sampling distribution
+
+    Args:
+        sampler (CompiledSampler): compiled sampler
+        rules (CompiledRules): compiled rules
+        amount (int): images to plan
+        samples (int, optional): combinations drawn to estimate draws. Defaults to 20000.
+        max_states (int, optional): candidates a group may enumerate. Defaults to 1000000.
+        rng (np.random.Generator, optional): random generator. Defaults to np.random.default_rng(0).
+
+    Returns:
+        dict: folders, combinations (None if a group is too large), accept, effective, draws,
+            duplicates, rejected, last_draws and rare values expected less than once
+    """
+    rng = np.random.default_rng(0) if rng is None else rng
+    folder_weights = np.diff(np.concatenate([[0.0], sampler.folder_cum]))
+    folders = []
+    for folder, components in zip(
+        sampler.folders, folder_components(rules, max_states)
+    ):
+        counted = all(c is not None for c in components)
+        folders.append(
+            {
+                "folder": folder,
+                "components": components,
+                "combinations": (
+                    int(np.prod([c["combinations"] for c in components], dtype=object))
+                    if counted
+                    else None
+                ),
+                "accept": (
+                    float(np.prod([c["accept"] for c in components]))
+                    if counted
+                    else None
+                ),
+            }
+        )
+    report = {
+        "amount": amount,
+        "folders": [{k: v for k, v in f.items() if k != "components"} for f in folders],
+        "combinations": None,
+        "accept": None,
+        "effective": None,
+        "draws": None,
+        "duplicates": None,
+        "rejected": None,
+        "last_draws": None,
+        "rare": [],
+    }
+    if any(f["combinations"] is None for f in folders):
+        return report
+    weights = np.array(
+        [w * f["accept"] for w, f in zip(folder_weights, folders)], dtype=float
+    )
+    accept = float(weights.sum())
+    report["combinations"] = sum(
+        f["combinations"] for w, f in zip(folder_weights, folders) if w > 0
+    )
+    report["accept"] = accept
+    if accept <= 0:
+        return report
+    q = weights / accept
+    sum_sq = sum(
+        q_f**2 * float(np.prod([c["sum_sq"] for c in f["components"]]))
+        for q_f, f in zip(q, folders)
+    )
+    report["effective"] = 1 / sum_sq
+    report["rare"] = rare_values(sampler, folders, q, amount)
+
+    # sample combinations from the exact distribution with their log probability
+    folder_idx = rng.choice(len(q), samples, p=q)
+    log_p = np.log(q[folder_idx])
+    for f, folder in enumerate(folders):
+        rows = np.flatnonzero(folder_idx == f)
+        for c in folder["components"]:
+            picked = rng.choice(len(c["probs"]), len(rows), p=c["probs"])
+            log_p[rows] += np.log(c["probs"][picked])
+            for i in range(len(c["props"])):
+                other = rows[c["outputs"][picked, i] == OTHER]
+                if len(other):
+                    log_p[other] += np.log(
+                        rng.choice(
+                            c["other_probs"][i], len(other), p=c["other_probs"][i]
+                        )
+                    )
+    p = np.exp(log_p)
+
+    def unique_after(t: float) -> float:
+        return float(np.mean(-np.expm1(-p * t) / p))
+
+    n = report["combinations"]
+    if amount > n:
+        report["draws"] = float("inf")
+        return report
+    if amount == n or unique_after(1e300) <= amount:
+        # too close to capacity for the estimate, uniform coupon collector as a lower bound
+        draws = n * (np.log(n) - np.log(max(n - amount, 0.5)))
+        last_draws = n / (n - amount + 1)
+    else:
+        low, high = float(amount), float(amount)
+        while unique_after(high) < amount:
+            high *= 2
+        for _ in range(100):
+            middle = (low + high) / 2
+            low, high = (
+                (middle, high) if unique_after(middle) < amount else (low, middle)
+            )
+        draws = high
+        last_draws = 1 / max(float(np.mean(np.exp(-p * draws))), 1e-300)
+    report["draws"] = draws
+    report["duplicates"] = max(draws - amount, 0.0)
+    report["rejected"] = draws / accept - draws
+    report["last_draws"] = last_draws
+    return report
+
+
+def folder_components(
+    rules: CompiledRules, max_states: int = 1000000
+) -> list[list[dict | None]]:
+    """
+    count_component of every group of props in every folder
+
+    Args:
+        rules (CompiledRules): compiled rules
+        max_states (int, optional): candidates a group may enumerate. Defaults to 1000000.
+
+    Returns:
+        list[list[dict | None]]: components of each folder
+    """
+    groups, mentioned = rule_components(rules)
+    return [
+        [count_component(rules, f, g, mentioned, max_states) for g in groups]
+        for f in range(len(rules.sampler.folders))
+    ]
+
+
+def marginals(sampler: CompiledSampler, components: list[dict]) -> list[np.ndarray]:
+    """
+    probability of every value among rule-valid combinations of a folder
+
+    Args:
+        sampler (CompiledSampler): compiled sampler
+        components (list[dict]): components of the folder from folder_components
+
+    Returns:
+        list[np.ndarray]: probability of each value code of each prop
+    """
+    probs = [np.zeros(len(values)) for values in sampler.values]
+    for c in components:
+        for i, p in enumerate(c["props"]):
+            codes = c["outputs"][:, i]
+            concrete = codes != OTHER
+            np.add.at(probs[p], codes[concrete], c["probs"][concrete])
+            other = float(c["probs"][~concrete].sum())
+            probs[p][c["other_codes"][i]] += other * c["other_probs"][i]
+    return probs
+
+
+def value_capacity(
+    sampler: CompiledSampler, components: list[dict]
+) -> list[np.ndarray]:
+    """
+    number of rule-valid combinations of a folder containing each value,
+    no plan of unique images can use a value more often
+
+    Args:
+        sampler (CompiledSampler): compiled sampler
+        components (list[dict]): components of the folder from folder_components
+
+    Returns:
+        list[np.ndarray]: combinations of each value code of each prop
+    """
+    counts = [np.zeros(len(values), dtype=object) for values in sampler.values]
+    total = np.prod([c["combinations"] for c in components], dtype=object)
+    for c in components:
+        rest = total // c["combinations"] if c["combinations"] else 0
+        n_other = [len(codes) for codes in c["other_codes"]]
+        for out in c["outputs"]:
+            size = np.prod([n_other[i] for i, code in enumerate(out) if code == OTHER])
+            for i, p in enumerate(c["props"]):
+                if out[i] == OTHER:
+                    counts[p][c["other_codes"][i]] += rest * size // n_other[i]
+                else:
+                    counts[p][out[i]] += rest * size
+    return counts
+
+
+def rare_values(
+    sampler: CompiledSampler, folders: list[dict], q: np.ndarray, amount: int
+) -> list[tuple[str, str, float]]:
+    """
+    values with positive ratio which are expected less than once in amount images
+
+    Args:
+        sampler (CompiledSampler): compiled sampler
+        folders (list[dict]): folders with components from analyze_capacity
+        q (np.ndarray): probability of each folder among valid combinations
+        amount (int): images to plan
+
+    Returns:
+        list[tuple[str, str, float]]: (prop, value, expected count)
+    """
+    expected = [np.zeros(len(values)) for values in sampler.values]
+    positive = [np.zeros(len(values), dtype=bool) for values in sampler.values]
+    for f, folder in enumerate(folders):
+        for p, probs in enumerate(marginals(sampler, folder["components"])):
+            positive[p][sampler.codes[f][p][sampler.weights[f][p] > 0]] = True
+            expected[p] += q[f] * probs * amount
+    return [
+        (prop, sampler.values[p][code], float(expected[p][code]))
+        for p, prop in enumerate(sampler.props)
+        for code in np.flatnonzero(positive[p] & (expected[p] < 1))
+    ]
+
+
+def print_capacity(report: dict):
+    """
+    print the result of analyze_capacity and warn about runs which will stall
+
+    Args:
+        report (dict): result of analyze_capacity
+    """
+    for f in report["folders"]:
+        if f["combinations"] is None:
+            print(f"{f['folder']}: too many values linked by rules to count exactly")
+        else:
+            print(
+                f"{f['folder']}: {f['combinations']} rule-valid combinations, "
+                f"{f['accept']:.1%} of candidates pass rules"
+            )
+    if report["combinations"] is None:
+        return
+    print(
+        f"total {report['combinations']} combinations, "
+        f"about {report['effective']:.0f} equally likely ones given ratios"
+        if report["effective"]
+        else f"total {report['combinations']} combinations"
+    )
+    for prop, value, expected in report["rare"][:5]:
+        print(
+            f"warning: {prop} {value} is expected {expected:.2f} times in {report['amount']} images"
+        )
+    if len(report["rare"]) > 5:
+        print(
+            f"warning: and {len(report['rare']) - 5} more values expected less than once"
+        )
+    if report["draws"] is None:
+        return
+    if report["draws"] == float("inf"):
+        print(f"warning: {report['amount']} unique images can not be planned")
+        return
+    print(
+        f"expected draws for {report['amount']} unique images: {report['draws']:.0f}, "
+        f"{report['duplicates']:.0f} duplicates and {report['rejected']:.0f} candidates rejected by rules"
+    )
+    if report["last_draws"] > 100:
+        print(
+            f"warning: uniqueness saturates, the last images need about "
+            f"{report['last_draws']:.0f} draws each, reduce the amount or add parts"
+        )
+
+
+if __name__ == "__main__":
+    from config import AMOUNT
+    from generate import sampler, rules
+
+    print_capacity(analyze_capacity(sampler, rules, AMOUNT))
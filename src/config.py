@@ -2,8 +2,10 @@ import os
 from enum import Enum
 from dotenv import load_dotenv
 from pathlib import Path
+from typing import TYPE_CHECKING
 
-from httpx._types import ProxiesTypes
+if TYPE_CHECKING:
+    from httpx._types import ProxiesTypes
 
 load_dotenv()
 ROOT_DIR = Path(__file__).parent.parent
@@ -21,6 +23,7 @@ LAYER_NAMES = [
     # "02_First Letter",
     # "03_Second Letter",
 ]
+LAYER_FACTS = "./layer_facts.json"  # cached checks and alpha facts of part files, re-checked only when size or mtime change
 # ----------------------------------------------------------------------------------------------------
 
 
@@ -48,15 +51,67 @@ class Quality(Enum):
     maximum = "maximum"
 
 
+class OutputFormat(Enum):
+    jpeg = "jpeg"  # JPEG with QUALITY preset
+    png = "png"  # lossless PNG with PNG_COMPRESS_LEVEL
+    webp_lossless = "webp_lossless"  # lossless WebP
+    webp = "webp"  # lossy WebP with WEBP_QUALITY
+
+
+OUTPUT_EXTENSIONS = {
+    "jpeg": "jpg",
+    "png": "png",
+    "webp_lossless": "webp",
+    "webp": "webp",
+}
+OUTPUT_CONTENT_TYPES = {
+    "jpeg": "image/jpeg",
+    "png": "image/png",
+    "webp_lossless": "image/webp",
+    "webp": "image/webp",
+}
+
+
+class SamplingMode(Enum):
+    rejection = "rejection"  # draw full candidates, resample when rules reject
+    constrained = "constrained"  # remove excluded values while drawing
+    quota = "quota"  # exact value counts from ratios, combinations assigned to match
+
+
+class Compositor(Enum):
+    pil = "pil"  # PIL paste layer by layer
+    numpy = "numpy"  # premultiplied NumPy arrays, pixel identical to pil and faster on big canvas
+
+
 # generate--------------------------------------------------------------------------------------------
 START_ID = 1  # start id of generated images
 IMAGES = "./images"  # folder save generate images
 METADATA = "./metadata"  # folder save metadata
+PLAN = "./plan.csv"  # manifest of planned attributes, written by plan stage and read by render stage
+LAYER_HASHES = "./plan_layers.json"  # content hash of part files the rendered images were drawn from
 AMOUNT = 100  # amount of images to generate
 NAMES = ["Test NFT"]  # custom NFT names, random choice from list
 DESCRIPTION = "generate images test NFT description"  # custom NFT description
-QUALITY = Quality.web_very_high.value
+OUTPUT_FORMAT = OutputFormat.jpeg.value
+QUALITY = Quality.web_very_high.value  # JPEG quality preset
+PNG_COMPRESS_LEVEL = 6  # 0-9, higher is smaller and slower
+WEBP_QUALITY = 80  # 0-100, lossy WebP quality, for lossless it is compression effort
+IMAGE_EXTENSION = OUTPUT_EXTENSIONS[OUTPUT_FORMAT]  # extension of generated images
+IMAGE_CONTENT_TYPE = OUTPUT_CONTENT_TYPES[OUTPUT_FORMAT]
 USE_MULTIPROCESS = True  # set False for debug
+WORKERS = 0  # render processes, 0 uses cpu_count() - 1
+CHUNK_SIZE = 32  # planned tokens handed to a free worker at a time
+LAYER_CACHE_MB = 1024  # memory bound of decoded part layers cached by each process
+COMPOSITOR = Compositor.pil.value
+PREFIX_CACHE_MB = 256  # memory bound of partial composites kept for tokens sharing lower layers, 0 to disable
+WARM_LAYER_CACHE = True  # decode used part layers when each worker starts
+ENCODER_THREADS = 2  # threads per process encoding and writing images, 0 to save inline
+WRITE_QUEUE_SIZE = 8  # finished images waiting for an encoder thread
+WRITE_BUFFER_KB = 1024  # write buffer of each image file
+JOURNAL_FSYNC_SECONDS = 5  # min seconds between attr.csv fsyncs, 0 syncs every chunk
+SAMPLE_BATCH_SIZE = 256  # candidates per vectorized sampler call, 1 draws one by one
+SAMPLING_MODE = SamplingMode.rejection.value
+SEED = None  # int to make collections reproducible whatever the worker count, None for fresh entropy
 # ----------------------------------------------------------------------------------------------------
 
 
@@ -71,7 +126,7 @@ UPLOAD_MYSTERY_BOX_METADATA = True  # if don't want to upload metadata, set Fals
 UPLOAD_METADATA = True  # set False if don't want to upload metadata
 PIN_FILES = False  # if want to upload permanently, set to True
 IPFS_INFO_BACKUP = "./ipfs_info_backup.json"  # backup ipfs info
-PROXIES: ProxiesTypes = {
+PROXIES: "ProxiesTypes" = {
     "http://": "http://127.0.0.1:7890",
     "https://": "http://127.0.0.1:7890",
 }  # if in China, you need set proxy to access IPFS node
@@ -87,3 +142,9 @@ BASEURL = "ipfs://Qxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx/"
 CONTRACT = "0x8888888888888888888888888888888888888888"
 ID_TO_REFRESH = []  # if empty will refresh all
 OPENSEA_KEY = os.getenv("OPENSEA_KEY")  # same as previous line
+
+
+# pipeline--------------------------------------------------------------------------------------------
+STATE = "./state.db"  # sqlite project state: parts, planned and rendered tokens, content hashes, CIDs and finished stages
+ARROW_TABLES = "./tables"  # folder of typed Arrow copies of ratio.csv, rules.csv, plan.csv and attr.csv, read memory mapped while the csv is unchanged. Needs pyarrow, set None to always parse the csv
+# ----------------------------------------------------------------------------------------------------
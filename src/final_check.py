@@ -1,8 +1,17 @@
 import hashlib, os
 import pandas as pd
 import numpy as np
-from generate import random_attr, df_pac
-from config import IMAGES, START_ID, CHECK_DUPLICATE_TRAITS_INDEX, SHUFFLE
+from generate import random_attr, tables
+from writer import list_images
+from state import record_stage, record_tokens, drop_tokens
+from storage import write_table
+from config import (
+    IMAGES,
+    START_ID,
+    CHECK_DUPLICATE_TRAITS_INDEX,
+    SHUFFLE,
+    IMAGE_EXTENSION,
+)
 
 
 def remove_duplicate_by_traits(trait_col_index: list = [], root: str = IMAGES):
@@ -14,11 +23,10 @@ def remove_duplicate_by_traits(trait_col_index: list = [], root: str = IMAGES):
         trait_col_index (list, optional): column indexes to check, if list is empty, compare all columns. Defaults to [].
     """
     if len(trait_col_index) == 0:
+        df_pac = tables()["df_pac"]
         trait_col_index = [i + 1 for i in range(len(df_pac.index.levels[1]))]
 
-    get_file_list = lambda r: list(
-        filter(lambda f: f.split(".")[1] == "png", os.listdir(r))
-    )
+    get_file_list = lambda r: list_images(r)
     file_list = get_file_list(root)
     duplicates = []
     hash_keys = dict()
@@ -41,6 +49,7 @@ def remove_duplicate_by_traits(trait_col_index: list = [], root: str = IMAGES):
         print("no duplicate images by traits")
     for index in duplicates:
         os.remove(os.path.join(root, file_list[index[0]]))
+    drop_tokens([os.path.join(root, file_list[index[0]]) for index in duplicates])
     file_list = get_file_list(root)
     print(f"Remain {len(file_list)} images")
 
@@ -65,7 +74,7 @@ def generate_csv(sort=True) -> pd.DataFrame:
             else 0
         )
         for file in files:
-            if os.path.splitext(file)[1] == ".png":
+            if os.path.splitext(file)[1] == f".{IMAGE_EXTENSION}":
                 old_path = os.path.join(root, file)
                 new_file = str(n) + "-" + "-".join(file.split("-")[1:])
                 path = os.path.join(IMAGES, new_file)
@@ -78,19 +87,25 @@ def generate_csv(sort=True) -> pd.DataFrame:
     else:
         print("images not sort")
     df = pd.DataFrame(all_data, columns=cols).drop(columns=["index"])
-    df.to_csv(os.path.join(IMAGES, "attr.csv"), index=False)
+    # stored as generate_images_from_attr_csv reads it
+    write_table(
+        df,
+        os.path.join(IMAGES, "attr.csv"),
+        categories=cols[2:],
+        dtype=str,
+        keep_default_na=False,
+    )
+    record_tokens([(path, None, args) for _, path, *args in all_data], rendered=True)
+    record_stage("check", f"{len(df)} images")
     return df
 
 
-RENAME_DF = generate_csv(SHUFFLE)
-
-
 if __name__ == "__main__":
+    rename_df = generate_csv(SHUFFLE)
     remove_duplicate_by_traits(CHECK_DUPLICATE_TRAITS_INDEX)
-    df_pac["actual"] = 0.0
     # show porperty ratio, if not satisfied, delete some or regenerate
     for col in [i["trait_type"] for i in random_attr()]:
-        array = RENAME_DF[col]
+        array = rename_df[col]
         uniques, counts = np.unique(array, return_counts=True)
         percentages = dict(zip(uniques, counts / len(array)))
         prop_df = pd.DataFrame.from_dict(percentages, orient="index", columns=[col])
@@ -11,6 +11,7 @@ from config import (
     OPENSEA_KEY,
 )
 import regex as re
+from state import record_stage
 
 failed_base_urls = []
 failed_image_urls = []
@@ -243,3 +244,4 @@ if __name__ == "__main__":
         end_id = min(AMOUNT, start_id + 100 - 1)
         print(f"Request {start_id} to {end_id}")
         main(start_id, end_id)
+    record_stage("refresh", f"tokens {start} to {AMOUNT}")
@@ -1,31 +1,58 @@
 import os
-from PIL import Image
 import pandas as pd
 import numpy as np
-from random import sample, random
-from numpy.random import choice
-from get_table import files_path
-from pathlib import Path
+from get_table import part_layers, hash_files
+from sampler import CompiledSampler, token_rng, process_rng
+from rules import CompiledRules, parse_prop_values
+from storage import read_table
+from capacity import analyze_capacity, print_capacity
+from quota import plan_quota
+from writer import ImageWriter, print_writer_stats, list_images
+from journal import Journal, read_journal, is_complete_image
+from state import (
+    record_stage,
+    record_tokens,
+    mark_rendered,
+    record_hashes,
+    forget_uploads,
+)
+from render import (
+    PrefixCompositor,
+    layer_cache,
+    warm_layer_cache,
+    print_layer_cache_stats,
+)
 from config import (
-    W,
-    H,
     PARTS_DICT,
     FOLDERS,
     WEIGHTS,
     IMAGES,
     QUALITY,
+    OUTPUT_FORMAT,
+    IMAGE_EXTENSION,
     AMOUNT,
     START_ID,
-    EXTENSION,
-    ROOT_DIR,
     USE_MULTIPROCESS,
+    SAMPLE_BATCH_SIZE,
+    SAMPLING_MODE,
+    SEED,
+    SamplingMode,
+    PLAN,
+    LAYER_HASHES,
+    WARM_LAYER_CACHE,
+    WORKERS,
+    CHUNK_SIZE,
 )
 from multiprocessing import Pool, cpu_count
 import warnings
-from typing import TypedDict
-from copy import deepcopy
+from typing import Iterator, TypedDict
+import argparse
+import glob
+import json
+import shutil
+import time
 
-rule_df = pd.read_csv("./rules.csv").dropna()
+SEEDED_BATCH_SIZE = 16  # candidates drawn per call from a token stream, changing it changes seeded plans
 
 
 def check_rules(df: pd.DataFrame) -> bool:
@@ -56,95 +83,106 @@ class RandomAttr(TypedDict):
     trait_type: str
 
 
-def apply_rules(random: RandomAttr, df: pd.DataFrame) -> tuple[bool, RandomAttr]:
+def apply_rules(
+    random: list[RandomAttr], df: pd.DataFrame
+) -> tuple[bool, list[RandomAttr]]:
     """
     helper function to apply rules
 
     Args:
-        random (RandomAttr): input random attribute
+        random (list[RandomAttr]): input random attribute
         rule_df (DataFrame): format rule dataframe
 
     Returns:
-        tuple[bool,RandomAttr]: (is_valid, valid_random_attr)
+        tuple[bool,list[RandomAttr]]: (is_valid, valid_random_attr)
     """
-    random_source = deepcopy(random)
-    for _, row in df.iterrows():  # iter over rules
-        rule = row["rule"]
-        if rule == 0:
-            continue
+    rule_df, sampler = tables()["rule_df"], tables()["sampler"]
+    compiled = tables()["rules"] if df is rule_df else CompiledRules(df, sampler)
+    folder_index, codes = sampler.encode(random)
+    valid, codes = compiled.apply(np.array([folder_index]), codes[None, :])
+    if not valid[0]:
+        return (False, "")  # type: ignore
+    return (True, sampler.decode(folder_index, codes[0]))
 
-        restrict_prop, restrict_value = row["prop"], row["value"]
 
-        target_attr = next(attr for attr in random_source if attr["value"][1] == restrict_prop)
-        to_change_value = target_attr["value"][2]
+warnings.simplefilter(action="ignore", category=FutureWarning)
 
-        if to_change_value != restrict_value:
-            continue
 
-        rule_prop_value: list[tuple[str]] | None = eval(row["list_prop_value"])
+def random_attr() -> list[RandomAttr]:
+    """
+    helper function to generate random attributes
 
-        if rule == -1:
-            for prop_value in rule_prop_value:
-                prop, new_value = prop_value
-                for attr in random_source:
-                    if attr["trait_type"] == prop and attr["value"][2] == new_value:
-                        return (False, "")
+    Returns:
+        List: [{"value": value, "trait_type": prop}]
+    """
+    sampler = tables()["sampler"]
+    folder_idx, codes = sampler.draw(1)
+    return sampler.decode(folder_idx[0], codes[0])
 
-        modified_indices = set()
 
-        if rule == 1:
-            prop, new_value = (
-                sample(rule_prop_value, 1)[0]
-                if len(rule_prop_value) > 1
-                else rule_prop_value[0]
-            )
+def iter_valid_attr(
+    batch_size: int = SAMPLE_BATCH_SIZE,
+    mode: str = SAMPLING_MODE,
+    rng: np.random.Generator | None = None,
+) -> Iterator[tuple[int, np.ndarray]]:
+    """
+    endless stream of integer encoded attributes which satisfy rules,
+    batch_size candidates are drawn and checked per vectorized call
 
-            for idx, attr in enumerate(random_source):
-                if attr["trait_type"] == prop:
-                    if idx in modified_indices:
-                        continue
-                    try:
-                        index = random_source.index(attr)
-                    except ValueError:
-                        return (False, "")
-                    random_source[index] = {
-                        "value": (attr["value"][0], attr["value"][1], new_value),
-                        "trait_type": prop,
-                    }
-                    modified_indices.add(index)
+    Args:
+        batch_size (int, optional): candidates drawn at once. Defaults to SAMPLE_BATCH_SIZE.
+        mode (str, optional): SamplingMode value. Defaults to SAMPLING_MODE.
+        rng (np.random.Generator, optional): random generator. Defaults to process_rng().
 
-    return (True, random_source)
+    Yields:
+        tuple[int, np.ndarray]: (folder index, value codes)
+    """
+    sampler, rules = tables()["sampler"], tables()["rules"]
+    while True:
+        if mode == SamplingMode.constrained.value:
+            folder_idx, codes, valid = rules.draw_constrained(batch_size, rng)
+        else:
+            folder_idx, codes = sampler.draw(batch_size, rng)
+            valid, codes = rules.apply(folder_idx, codes, rng)
+        sampling_stats["drawn"] += batch_size
+        sampling_stats["rejected"] += int(batch_size - valid.sum())
+        yield from zip(folder_idx[valid], codes[valid])
 
 
-warnings.simplefilter(action="ignore", category=FutureWarning)
+def print_sampling_stats(mode: str = SAMPLING_MODE):
+    """
+    print how many candidates were rejected, and how many rejection sampling would reject
 
+    Args:
+        mode (str, optional): SamplingMode value. Defaults to SAMPLING_MODE.
+    """
+    rules = tables()["rules"]
+    accepted = sampling_stats["drawn"] - sampling_stats["rejected"]
+    print(
+        f"{mode} sampling: {sampling_stats['rejected']} candidates rejected by rules, "
+        f"{sampling_stats['duplicate']} duplicates"
+    )
+    if mode == SamplingMode.constrained.value:
+        rate = rules.rejection_rate()
+        naive = accepted * rate / (1 - rate) if rate < 1 else float("inf")
+        print(f"rejection sampling would reject about {naive:.0f} candidates")
 
-def random_attr() -> list[RandomAttr]:
+
+def check_satisfiable():
     """
-    helper function to generate random attributes
+    check rules.csv before generation, raise if a folder has no valid combination
+    and print values which can never be generated
 
-    Returns:
-        List: [{"value": value, "trait_type": prop}]
+    Raises:
+        ValueError: if a folder with positive weight has no rule-valid combination
     """
-    attributes = []
-    select_folder: str = choice(FOLDERS, p=WEIGHTS)
-    for prop in props:
-        k = random()
-        ratio_arr: np.ndarray = df_pac.query(
-            f"(folder == '{select_folder}') & (prop == '{prop}')"
-        ).ratio.values
-        cum_arr = np.cumsum(ratio_arr) - k
-        first_index = next(x[0] for x in enumerate(cum_arr) if x[1] > 0)
-        value: tuple = df_pac.loc[(select_folder), (prop), :].index[
-            first_index
-        ]  # in pandas 1.4, loc is not return tuple but single element
-        if type(value) is str:
-            attributes.append(
-                {"value": (select_folder, prop, value), "trait_type": prop}
-            )
+    rules = tables()["rules"]
+    for folder, prop, value in rules.find_unsatisfiable():
+        if prop is None:
+            if PARTS_DICT[folder] > 0:
+                raise ValueError(f"no combination in {folder} satisfies rules.csv")
         else:
-            attributes.append({"value": value, "trait_type": prop})
-    return attributes
+            print(f"{folder} {prop} {value} can never be generated under rules.csv")
 
 
 def get_ratio(x):
@@ -163,154 +201,786 @@ def get_ratio(x):
     return custom_ratio * folder_ratio
 
 
-def has_transparency(img):
-    if img.info.get("transparency", None) is not None:
-        return True
-    if img.mode == "P":
-        transparent = img.info.get("transparency", -1)
-        for _, index in img.getcolors():
-            if index == transparent:
-                return True
-    elif img.mode == "RGBA":
-        extrema = img.getextrema()
-        if extrema[3][0] < 255:
-            return True
-
-    return False
+class Tables(TypedDict):
+    rule_df: pd.DataFrame
+    df_csv: pd.DataFrame
+    df_group: pd.DataFrame
+    df_pac: pd.DataFrame
+    props: np.ndarray
+    sampler: CompiledSampler
+    rules: CompiledRules
 
 
-def generate_func(
-    start_index: int,
-    end_index: int,
-    start_id: int = 0,
-):
+def load_tables(
+    ratio_path: str = "./ratio.csv", rules_path: str = "./rules.csv"
+) -> Tables:
     """
-    generate images function single process
+    read ratio.csv and rules.csv and compile them for sampling
 
     Args:
-        start_index (int): start index
-        end_index (int): end index
-        start_id (int, optional): which index start. Defaults to 0.
+        ratio_path (str, optional): ratio table path. Defaults to "./ratio.csv".
+        rules_path (str, optional): rules table path. Defaults to "./rules.csv".
 
     Returns:
-        pd.DataFrame: generated dataframe by this process
+        Tables: dataframes, props in overlay order, compiled sampler and rules
     """
+    rule_df = read_table(
+        rules_path, parsers={"list_prop_value": parse_prop_values}
+    ).dropna()
+    df_csv = read_table(ratio_path)
+    df_group = df_csv.groupby(["folder", "prop", "value"]).apply(get_ratio).to_frame()
+    df_pac = (
+        df_group.groupby(level=["folder", "prop"])
+        .apply(lambda x: x / float(x.sum()))
+        .rename(columns={0: "ratio"})
+        .sort_values(by=["ratio"], ascending=[True])
+    )
+    props = df_csv["prop"].unique()
+    sampler = CompiledSampler(df_pac, props, FOLDERS, WEIGHTS)
+    rules = CompiledRules(rule_df, sampler)
+    return {
+        "rule_df": rule_df,
+        "df_csv": df_csv,
+        "df_group": df_group,
+        "df_pac": df_pac,
+        "props": props,
+        "sampler": sampler,
+        "rules": rules,
+    }
 
-    cols = ["path"] + [i["trait_type"] for i in random_attr()]
-    df_batch = pd.DataFrame(columns=cols)
-    for i in range(start_index, end_index):
-        index = i + start_id
 
-        is_valid_attr = False
-        is_not_duplicate = False
-        while not is_valid_attr or not is_not_duplicate:
-            attributes = random_attr()
-            is_valid_attr, attributes = apply_rules(attributes, rule_df)
-            if not is_valid_attr:
-                continue
+def tables() -> Tables:
+    """
+    tables of the working directory, loaded on first use and kept for the process,
+    forked workers inherit them
 
-            # avoid duplicate
-            key = hash(str(attributes))
-            if key in used_attributes:
-                continue
+    Returns:
+        Tables: result of load_tables
+    """
+    global _tables
+    if _tables is None:
+        _tables = load_tables()
+    return _tables
 
-            used_attributes[key] = attributes
-            is_not_duplicate = True
 
-        # Get the images to be read in the order of overlay
-        paths = [
-            next(
-                path
-                for path in files_path
-                if attr["trait_type"] == path.split(os.sep)[1].split("_")[1]
-                and attr["value"][0] == path.split(os.sep)[0]
-                and attr["value"][2] == Path(path).stem
+def __getattr__(name: str):
+    """
+    module attributes like generate.props and generate.sampler are loaded on first
+    access, so importing generate reads no table
+    """
+    if name in Tables.__annotations__:
+        return tables()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def plan_unique_attr(
+    amount: int, max_stall: int = 1000, seed: int | None = SEED, start_id: int = 0
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    draw amount rule-valid combinations which are unique across the whole run,
+    done once in the parent so no worker ever renders a duplicate.
+    With a seed every token draws from its own stream keyed by its id, so the plan
+    only depends on the seed and the tables
+
+    Args:
+        amount (int): amount of combinations
+        max_stall (int, optional): give up after this many batches without a new combination. Defaults to 1000.
+        seed (int, optional): collection seed, None for fresh entropy. Defaults to SEED.
+        start_id (int, optional): id of the first token, keys the seeded streams. Defaults to 0.
+
+    Raises:
+        ValueError: if not enough unique combinations can be found
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: (folder indexes with shape (amount,), value codes with shape (amount, props))
+    """
+    props = tables()["props"]
+    folder_idx = np.empty(amount, dtype=np.int32)
+    codes = np.empty((amount, len(props)), dtype=np.int32)
+    used = set()
+    stall = 0
+    batch_size = SAMPLE_BATCH_SIZE if seed is None else SEEDED_BATCH_SIZE
+    candidates = iter_valid_attr() if seed is None else None
+    n = 0
+    while n < amount:
+        if candidates is None:
+            candidates = iter_valid_attr(
+                batch_size, rng=token_rng(seed, start_id + n)  # type: ignore
             )
-            for attr in attributes
-        ]
-        base_img = Image.new("RGB", (W, H), (0, 0, 0))
-        for path in paths:
-            img = Image.open(path, "r")
-            if not has_transparency(img):
-                img = img.convert("RGBA")
-            base_img.paste(img, (0, 0), mask=img)
-        # save images
-        filename = (
-            f"{index}-{'-'.join(list(map(lambda i: i['value'][-1] ,attributes)))}.png"
-        )
-        base_img.save(
-            os.path.join(save_folder, filename),
-            format="jpeg",
-            quality=QUALITY,
-        )
-        # add porpety
-        row_dict = {"path": os.path.join(save_folder, filename)} | {
-            i["trait_type"]: i["value"][-1] for i in attributes
-        }
-        new_row_df = pd.DataFrame.from_dict(row_dict, orient="index").T
-        df_batch = pd.concat(
-            [df_batch, new_row_df],
-            ignore_index=True,
-        )
-    return df_batch
+        folder_index, row = next(candidates)
+        key = (int(folder_index), row.tobytes())
+        if key in used:
+            sampling_stats["duplicate"] += 1
+            stall += 1
+            if stall > max_stall * batch_size:
+                raise ValueError(
+                    f"only {n} unique combinations found, reduce the amount or add more parts"
+                )
+            continue
+        stall = 0
+        used.add(key)
+        folder_idx[n], codes[n] = folder_index, row
+        n += 1
+        if seed is not None:
+            candidates = None
+    return folder_idx, codes
 
 
-def generate_images(
+def plan_images(
     df_csv: pd.DataFrame,
     amount: int,
     save_folder: str = "./images",
     start_id: int = 0,
+    plan_path: str = PLAN,
+    seed: int | None = SEED,
 ) -> pd.DataFrame:
     """
-    generate images main function, check prequisites and generate images in parallel
+    plan stage, check prequisites, sample all attributes up front and save them to a manifest
 
     Args:
         df_csv (pd.DataFrame): source dataframe to use
         amount (int): image amount to generate
         save_folder (str, optional): images save folder. Defaults to "./images".
         start_id (int, optional): which index start. Defaults to 0.
+        plan_path (str, optional): manifest path. Defaults to PLAN.
+        seed (int, optional): collection seed, None for fresh entropy. Defaults to SEED.
 
     Returns:
-        pd.DataFrame: all generated images with save to attr.csv and return
+        pd.DataFrame: manifest, same columns as attr.csv plus folder
     """
+    rule_df, props = tables()["rule_df"], tables()["props"]
+    sampler, rules = tables()["sampler"], tables()["rules"]
     if not check_rules(rule_df):
         raise ValueError("Rules are not satisfied")
-    prop_count_df = df_csv.groupby(["folder", "prop"]).count()
-    sum_count = 0
-    for _folder in FOLDERS:
-        folder_df = prop_count_df.query(f"folder == '{_folder}'")["ratio"]
-        max_count = folder_df.values.cumprod()[-1]
-        sum_count += max_count
+    check_satisfiable()
+    report = analyze_capacity(sampler, rules, amount)
+    print_capacity(report)
+    capacity = report["combinations"]
+    if capacity is None:
+        # rules link too many values to count exactly, without rules is an upper bound
+        prop_count_df = df_csv.groupby(["folder", "prop"]).count()
+        capacity = 0
+        for _folder in FOLDERS:
+            folder_df = prop_count_df.query(f"folder == '{_folder}'")["ratio"]
+            capacity += folder_df.values.cumprod()[-1]
     assert (
-        amount <= sum_count and amount > 0
+        amount <= capacity and amount > 0
     ), "Generate too much, there will be duplicate generation, should increase the number of material or reduce the total amount"
-    min_ratio_except_zero = np.min(df_pac[df_pac["ratio"] > 0].ratio.values)
-    assert (
-        min_ratio_except_zero * amount >= 1
-    ), "The number generated is too small to reflect the minimum probability and the total should be increased"
+
+    if SAMPLING_MODE == SamplingMode.quota.value:
+        rng = process_rng() if seed is None else np.random.default_rng(seed)
+        folder_idx, codes, swaps = plan_quota(sampler, rules, amount, rng)
+        print(f"quota sampling: {swaps} swaps to meet rules and uniqueness")
+    else:
+        folder_idx, codes = plan_unique_attr(amount, seed=seed, start_id=start_id)
+        print_sampling_stats()
+    data = {
+        prop: np.array(sampler.values[p], dtype=object)[codes[:, p]]
+        for p, prop in enumerate(props)
+    }
+    names = ["-".join(values) for values in zip(*data.values())]
+    data = {
+        "path": [
+            os.path.join(save_folder, f"{index}-{name}.{IMAGE_EXTENSION}")
+            for index, name in zip(range(start_id, start_id + amount), names)
+        ]
+    } | data
+    data["folder"] = np.array(sampler.folders, dtype=object)[folder_idx]
+    df_plan = pd.DataFrame(data)
+    df_plan.to_csv(plan_path, index=False)
+    record_tokens(
+        [
+            (path, folder, values)
+            for path, folder, *values in df_plan[["path", "folder", *props]].itertuples(
+                index=False, name=None
+            )
+        ],
+        rendered=False,
+    )
+    record_stage("plan", f"{amount} tokens, {SAMPLING_MODE} sampling")
+    return df_plan
+
+
+def read_plan(plan_path: str = PLAN) -> pd.DataFrame:
+    """
+    read a manifest, attr.csv without folder column is accepted too,
+    the folder of a row is the first folder having all its values
+
+    Args:
+        plan_path (str, optional): manifest path. Defaults to PLAN.
+
+    Returns:
+        pd.DataFrame: manifest with path, props and folder columns
+    """
+    props = tables()["props"]
+    return infer_folders(
+        read_table(
+            plan_path,
+            categories=["folder", *props],
+            dtype=str,
+            keep_default_na=False,
+        )
+    )
+
+
+def infer_folders(df_plan: pd.DataFrame) -> pd.DataFrame:
+    """
+    add folder column to rows without it,
+    the folder of a row is the first folder having all its values
+
+    Args:
+        df_plan (pd.DataFrame): rows with props columns
+
+    Raises:
+        ValueError: if a value is not a value of its prop or no folder has all values of a row
+
+    Returns:
+        pd.DataFrame: rows with folder column
+    """
+    props, sampler, rules = tables()["props"], tables()["sampler"], tables()["rules"]
+    if "folder" not in df_plan.columns:
+        folders = []
+        for i, values in enumerate(df_plan[props].itertuples(index=False, name=None)):
+            slots = []
+            for p, value in enumerate(values):
+                if value not in sampler.value_index[p]:
+                    raise ValueError(
+                        f'"{value}" is not valid prop at row "{i}" & column "{props[p]}"'
+                    )
+                slots.append(rules.offsets[p] + sampler.value_index[p][value])
+            found = np.flatnonzero(rules.available[:, slots].all(axis=1))
+            if len(found) == 0:
+                raise ValueError(f"no parts folder has all values of row {i}: {values}")
+            folders.append(sampler.folders[found[0]])
+        df_plan["folder"] = folders
+    return df_plan
+
+
+def find_layer_path(folder: str, prop: str, value: str) -> str:
+    """
+    find the layer file of a value
+
+    Args:
+        folder (str): parts folder
+        prop (str): prop name
+        value (str): value name
+
+    Returns:
+        str: layer file path
+    """
+    return part_layers()[1][(folder, prop, value)]
+
+
+def layer_paths(df_plan: pd.DataFrame) -> list[str]:
+    """
+    unique layer files used by a manifest, most used first
+
+    Args:
+        df_plan (pd.DataFrame): manifest rows
+
+    Returns:
+        list[str]: layer file paths
+    """
+    props = tables()["props"]
+    counts = {}
+    for prop in props:
+        for (folder, value), count in (
+            df_plan.groupby(["folder", prop], observed=True).size().items()
+        ):
+            path = find_layer_path(folder, prop, value)
+            counts[path] = counts.get(path, 0) + count
+    return sorted(counts, key=counts.get, reverse=True)
+
+
+def sort_by_layers(df_plan: pd.DataFrame) -> pd.DataFrame:
+    """
+    sort manifest rows by layer prefix, so neighbours share as many lower layers as possible
+
+    Args:
+        df_plan (pd.DataFrame): manifest rows
+
+    Returns:
+        pd.DataFrame: sorted rows, index is kept
+    """
+    props = tables()["props"]
+    return df_plan.sort_values(["folder", *props], kind="stable")
+
+
+def render_func(df_plan: pd.DataFrame) -> tuple[list[list[str]], dict]:
+    """
+    render stage of a single process, composite and save every planned row
+
+    Args:
+        df_plan (pd.DataFrame): manifest rows to render
+
+    Returns:
+        tuple[list[list[str]], dict]: (rendered [path, *values] rows in render order, counters of this process)
+    """
+    global prefix_compositor, image_writer
+    props = tables()["props"]
+    if prefix_compositor is None:
+        prefix_compositor = PrefixCompositor()
+        image_writer = ImageWriter()
+    rows = []
+    columns = ["path", "folder", *props]
+    for path, folder, *values in sort_by_layers(df_plan)[columns].itertuples(
+        index=False, name=None
+    ):
+        # Get the images to be read in the order of overlay
+        paths = [
+            find_layer_path(folder, prop, value) for prop, value in zip(props, values)
+        ]
+        base_img = prefix_compositor.composite(paths)
+        # save images
+        image_writer.submit(base_img, path)  # type: ignore
+        # add porpety
+        rows.append([path, *values])
+    image_writer.flush()  # type: ignore
+    stats = (
+        layer_cache.stats()
+        | image_writer.get_stats()
+        | {  # type: ignore
+            "pid": os.getpid(),
+            "blends": prefix_compositor.blends,
+            "saved": prefix_compositor.saved,
+        }
+    )
+    return rows, stats
+
+
+def resume_rows(
+    attr_path: str, df_plan: pd.DataFrame, save_folder: str, workers: int
+) -> list[list[str]]:
+    """
+    check the output of an interrupted render, keep journaled rows whose values match
+    the manifest and whose image is complete, and rewrite attr.csv with them
+
+    Args:
+        attr_path (str): attr.csv path, the journal of the interrupted run
+        df_plan (pd.DataFrame): manifest of the run
+        save_folder (str): images save folder
+        workers (int): processes checking images
+
+    Raises:
+        ValueError: if attr.csv has rows not in the manifest
+
+    Returns:
+        list[list[str]]: [path, *values] rows which don't need rendering again
+    """
+    props = tables()["props"]
+    rows = journaled = read_journal(attr_path, len(props) + 1)
+    unknown = set(row[0] for row in rows) - set(df_plan["path"])
+    if unknown:
+        raise ValueError(
+            f"{len(unknown)} images in {attr_path} are not in the plan, e.g. {next(iter(unknown))}"
+        )
+    planned = {
+        path: values
+        for path, *values in df_plan[["path", *props]].itertuples(
+            index=False, name=None
+        )
+    }
+    # a crash can cut the last row inside a field, it is rendered again
+    rows = [row for row in rows if row[1:] == list(planned[row[0]])]
+    paths = [row[0] for row in rows]
+    if workers > 1:
+        with Pool(workers) as pool:
+            complete = pool.map(is_complete_image, paths, chunksize=64)
+    else:
+        complete = list(map(is_complete_image, paths))
+    done_rows = [row for row, ok in zip(rows, complete) if ok]
+    for file in os.listdir(save_folder):
+        if file.endswith(".part"):
+            os.remove(os.path.join(save_folder, file))
+    # rewrite aside then rename, so a crash now still leaves a usable journal
+    with Journal(attr_path + ".tmp", ["path", *props]) as journal:
+        journal.append(done_rows)
+    os.replace(attr_path + ".tmp", attr_path)
+    print(
+        f"resume: {len(done_rows)} images complete, {len(journaled) - len(done_rows)} broken, "
+        f"{len(df_plan) - len(done_rows)} to render"
+    )
+    return done_rows
+
+
+def sort_attr_csv(attr_path: str, plan_order: list[str]):
+    """
+    rewrite a finished attr.csv in plan order, so it doesn't depend on which worker finished first
+
+    Args:
+        attr_path (str): attr.csv path
+        plan_order (list[str]): image paths in plan order
+    """
+    props = tables()["props"]
+    position = {path: i for i, path in enumerate(plan_order)}
+    rows = read_journal(attr_path, len(props) + 1)
+    rows.sort(key=lambda row: position[row[0]])
+    with Journal(attr_path + ".tmp", ["path", *props]) as journal:
+        journal.append(rows)
+    os.replace(attr_path + ".tmp", attr_path)
+
+
+def shard_folder(save_folder: str, i: int, n: int) -> str:
+    """
+    output folder of a shard, next to save_folder
+
+    Args:
+        save_folder (str): images save folder
+        i (int): shard index, from 0
+        n (int): amount of shards
+
+    Returns:
+        str: folder of the shard
+    """
+    return f"{os.path.normpath(save_folder)}-shard-{i}-of-{n}"
+
+
+def shard_plan(df_plan: pd.DataFrame, folder: str, i: int, n: int) -> pd.DataFrame:
+    """
+    the i-th of n disjoint slices of a manifest, slices are contiguous in layer order
+    so every node keeps the prefix cache benefit
+
+    Args:
+        df_plan (pd.DataFrame): whole manifest
+        folder (str): output folder of the shard, paths are moved into it
+        i (int): shard index, from 0
+        n (int): amount of shards
+
+    Raises:
+        ValueError: if i is not in [0, n)
+
+    Returns:
+        pd.DataFrame: rows of the shard
+    """
+    if not 0 <= i < n:
+        raise ValueError(f"shard {i}/{n} is out of range, use 0/{n} to {n - 1}/{n}")
+    rows = np.array_split(np.arange(len(df_plan)), n)[i]
+    df_shard = sort_by_layers(df_plan).iloc[rows].copy()
+    df_shard["path"] = [
+        os.path.join(folder, os.path.basename(path)) for path in df_shard["path"]
+    ]
+    return df_shard
+
+
+def merge_shards(plan_path: str = PLAN, save_folder: str = "./images") -> int:
+    """
+    move the images of every shard folder into save_folder and combine their attr.csv,
+    the result is the same as rendering the plan on one machine
+
+    Args:
+        plan_path (str, optional): manifest path. Defaults to PLAN.
+        save_folder (str, optional): images save folder. Defaults to "./images".
+
+    Raises:
+        ValueError: if shard folders disagree, or images are missing, duplicated or differ from the plan
+
+    Returns:
+        int: amount of merged images
+    """
+    props = tables()["props"]
+    # the merging machine may have only the shard folders
+    os.makedirs(save_folder, exist_ok=True)
     assert (
-        len(list(filter(lambda f: f.split(".")[1] == "png", os.listdir(save_folder))))
-        == 0
+        len(list_images(save_folder)) == 0
     ), f"{save_folder} folder is not empty, backup the original data and tables first"
+    pattern = f"{os.path.normpath(save_folder)}-shard-*-of-*"
+    folders = sorted(glob.glob(pattern))
+    counts = set(folder.rsplit("-of-", 1)[1] for folder in folders)
+    if len(counts) != 1:
+        raise ValueError(f"expect shard folders of one run matching {pattern}")
+    df_plan = read_plan(plan_path)
+    planned = {
+        os.path.basename(path): [path, *values]
+        for path, *values in df_plan[["path", *props]].itertuples(
+            index=False, name=None
+        )
+    }
+    merged: dict[str, str] = {}
+    for folder in folders:
+        for path, *values in read_journal(
+            os.path.join(folder, "attr.csv"), len(props) + 1
+        ):
+            name = os.path.basename(path)
+            if name in merged:
+                raise ValueError(f"{name} is rendered by {merged[name]} and {folder}")
+            if planned.get(name, [None])[1:] != values:
+                raise ValueError(f"{path} does not match {plan_path}")
+            if not os.path.exists(path):
+                raise ValueError(f"{path} is in attr.csv but missing")
+            merged[name] = folder
+    missing = planned.keys() - merged.keys()
+    if missing:
+        raise ValueError(
+            f"{len(missing)} planned images are not rendered by {len(folders)} shards, e.g. {next(iter(missing))}"
+        )
+    for name, folder in merged.items():
+        shutil.move(os.path.join(folder, name), planned[name][0])
+    for folder in folders:
+        os.remove(os.path.join(folder, "attr.csv"))
+        if not os.listdir(folder):
+            os.rmdir(folder)
+    with Journal(os.path.join(save_folder, "attr.csv"), ["path", *props]) as journal:
+        journal.append(list(planned.values()))
+    save_layer_hashes(df_plan)
+    mark_rendered(list(df_plan["path"]))
+    record_stage("merge", f"{len(planned)} images from {len(folders)} shards")
+    return len(planned)
+
+
+def render_images(
+    plan_path: str = PLAN,
+    save_folder: str = "./images",
+    workers: int = WORKERS,
+    chunk_size: int = CHUNK_SIZE,
+    resume: bool = False,
+    shard: tuple[int, int] | None = None,
+) -> int:
+    """
+    render stage, render a manifest in parallel, can be rerun without resampling.
+    Small chunks of planned tokens are handed to whichever worker is free and
+    their rows are journaled to attr.csv as soon as their images are on disk
+
+    Args:
+        plan_path (str, optional): manifest path. Defaults to PLAN.
+        save_folder (str, optional): images save folder. Defaults to "./images".
+        workers (int, optional): render processes, 0 uses cpu_count() - 1. Defaults to WORKERS.
+        chunk_size (int, optional): planned tokens per chunk. Defaults to CHUNK_SIZE.
+        resume (bool, optional): continue an interrupted render, only missing or broken images are rendered. Defaults to False.
+        shard (tuple[int, int], optional): (i, n) renders only the i-th of n slices into its own folder, see merge_shards. Defaults to None.
 
-    processes = cpu_count() - 1 if USE_MULTIPROCESS else 1
-    pool = Pool(processes=processes)
-    start_end_indexs = list(
-        map(
-            lambda x: (
-                x * amount // processes,
-                (x + 1) * amount // processes,
-                start_id,
-            ),
-            range(processes),
+    Returns:
+        int: amount of images rendered by this call, attr.csv is in plan order when it returns
+    """
+    props = tables()["props"]
+    df_plan = df_plan_all = read_plan(plan_path)
+    if shard is not None:
+        save_folder = shard_folder(save_folder, *shard)
+        df_plan = shard_plan(df_plan, save_folder, *shard)
+        os.makedirs(save_folder, exist_ok=True)
+    if not resume:
+        assert (
+            len(list_images(save_folder)) == 0
+        ), f"{save_folder} folder is not empty, backup the original data and tables first, or use --resume"
+    plan_order = list(df_plan["path"])
+    workers = pool_size(workers)
+    attr_path = os.path.join(save_folder, "attr.csv")
+    if resume:
+        done_rows = resume_rows(attr_path, df_plan, save_folder, workers)
+        df_plan = df_plan[~df_plan["path"].isin([row[0] for row in done_rows])]
+        journal = Journal(attr_path)
+    else:
+        journal = Journal(attr_path, ["path", *props])
+    df_plan = sort_by_layers(df_plan)
+    amount = len(df_plan)
+    with journal:
+        if amount == 0:
+            print("all planned images are rendered")
+        else:
+            render_rows(df_plan, workers, chunk_size, journal)
+    sort_attr_csv(attr_path, plan_order)
+    if shard is None:
+        save_layer_hashes(df_plan_all)
+        mark_rendered(plan_order)
+        record_stage("render", f"{len(plan_order)} images")
+    else:
+        record_stage("render", f"shard {shard[0]}/{shard[1]}, {len(plan_order)} images")
+    return amount
+
+
+def save_layer_hashes(df_plan: pd.DataFrame, hashes_path: str = LAYER_HASHES):
+    """
+    save content hash of part files used by a rendered manifest
+
+    Args:
+        df_plan (pd.DataFrame): rendered manifest
+        hashes_path (str, optional): json path. Defaults to LAYER_HASHES.
+    """
+    hashes = hash_files(sorted(layer_paths(df_plan)))
+    with open(hashes_path, "w") as f:
+        json.dump(hashes, f, indent=0)
+    record_hashes(hashes)
+
+
+def token_layers(df_plan: pd.DataFrame) -> list[list[str] | None]:
+    """
+    layer files of every manifest row in overlay order
+
+    Args:
+        df_plan (pd.DataFrame): manifest rows
+
+    Returns:
+        list[list[str] | None]: layer file paths of each row, None if a value has no part file
+    """
+    props, layer_index = tables()["props"], part_layers()[1]
+    layers = []
+    for folder, *values in df_plan[["folder", *props]].itertuples(
+        index=False, name=None
+    ):
+        paths = [layer_index.get((folder, p, v)) for p, v in zip(props, values)]
+        layers.append(None if None in paths else paths)
+    return layers
+
+
+def update_images(
+    attr_path: str = os.path.join(IMAGES, "attr.csv"),
+    hashes_path: str = LAYER_HASHES,
+    workers: int = WORKERS,
+    chunk_size: int = CHUNK_SIZE,
+) -> list[str]:
+    """
+    re-render only tokens using part files changed since the last render,
+    attributes don't change so attr.csv is kept as is. Tokens are read from attr.csv,
+    which has the names after the attr stage and final_check, not from the plan
+
+    Args:
+        attr_path (str, optional): attr.csv of the rendered images. Defaults to IMAGES/attr.csv.
+        hashes_path (str, optional): hashes saved by the last render. Defaults to LAYER_HASHES.
+        workers (int, optional): render processes, 0 uses cpu_count() - 1. Defaults to WORKERS.
+        chunk_size (int, optional): planned tokens per chunk. Defaults to CHUNK_SIZE.
+
+    Raises:
+        ValueError: if part files of some tokens were deleted or renamed, the tokens are listed
+
+    Returns:
+        list[str]: token ids of re-rendered images, they need uploading again
+    """
+    df_attr = read_plan(attr_path)
+    with open(hashes_path) as f:
+        rendered = json.load(f)
+    layers = token_layers(df_attr)
+    used = set(path for paths in layers if paths is not None for path in paths)
+    lost = set(path for path in used if not os.path.exists(path))
+    unresolvable = [
+        os.path.basename(path).split("-")[0]
+        for path, paths in zip(df_attr["path"], layers)
+        if paths is None or lost.intersection(paths)
+    ]
+    if unresolvable:
+        raise ValueError(
+            f"{len(unresolvable)} tokens use part files which were deleted or renamed, "
+            f"restore the files or change the tokens with the attr stage: {' '.join(unresolvable)}"
         )
+    current = hash_files(sorted(set(path for paths in layers for path in paths)))
+    changed = set(
+        path for path, digest in current.items() if rendered.get(path) != digest
     )
+    for path in sorted(changed):
+        print(f"{path} changed")
+    affected = [i for i, paths in enumerate(layers) if changed.intersection(paths)]
+    if affected:
+        render_rows(
+            sort_by_layers(df_attr.iloc[affected]), pool_size(workers), chunk_size
+        )
+    save_layer_hashes(df_attr, hashes_path)
+    # the content changed under the same names, their CIDs are stale
+    forget_uploads([os.path.basename(path) for path in df_attr["path"].iloc[affected]])
+    record_stage("update", f"{len(affected)} images re-rendered")
+    return [
+        os.path.basename(path).split("-")[0] for path in df_attr["path"].iloc[affected]
+    ]
+
+
+def pool_size(workers: int = WORKERS) -> int:
+    """
+    render processes to start
+
+    Args:
+        workers (int, optional): requested processes, 0 uses cpu_count() - 1. Defaults to WORKERS.
+
+    Returns:
+        int: processes, 1 when USE_MULTIPROCESS is False
+    """
+    if not USE_MULTIPROCESS:
+        return 1
+    if workers <= 0:
+        return max(cpu_count() - 1, 1)
+    return workers
 
-    df_attr = pool.starmap(generate_func, start_end_indexs)
-    pd.concat(df_attr, ignore_index=True).to_csv(
-        os.path.join(save_folder, "attr.csv"), index=False
+
+def render_rows(
+    df_plan: pd.DataFrame,
+    workers: int,
+    chunk_size: int = CHUNK_SIZE,
+    journal: Journal | None = None,
+) -> dict:
+    """
+    render manifest rows in a pool, chunks go to whichever worker is free
+
+    Args:
+        df_plan (pd.DataFrame): manifest rows sorted by sort_by_layers
+        workers (int): render processes
+        chunk_size (int, optional): planned tokens per chunk. Defaults to CHUNK_SIZE.
+        journal (Journal, optional): rows of finished chunks are appended to it. Defaults to None.
+
+    Returns:
+        dict: counters summed over workers
+    """
+    amount = len(df_plan)
+    chunks = [
+        df_plan.iloc[start : start + chunk_size]
+        for start in range(0, amount, chunk_size)
+    ]
+    initargs = (layer_paths(df_plan),) if WARM_LAYER_CACHE else ([],)
+    worker_stats = {}
+    done = 0
+    start_time = time.time()
+    with Pool(workers, warm_layer_cache, initargs) as pool:
+        for rows, stats in pool.imap_unordered(render_func, chunks):
+            if journal is not None:
+                journal.append(rows)
+            worker_stats[stats["pid"]] = stats
+            done += len(rows)
+            speed = done / max(time.time() - start_time, 1e-9)
+            print(f"rendered {done}/{amount} images, {speed:.1f} images/s", end="\r")
+    print()
+    total = {
+        key: sum(stats[key] for stats in worker_stats.values())
+        for key in worker_stats[next(iter(worker_stats))]
+    }
+    total["max_queue_depth"] = max(
+        stats["max_queue_depth"] for stats in worker_stats.values()
+    )
+    print_layer_cache_stats(total)
+    print_writer_stats(total)
+    print(
+        f"prefix cache saved {total['saved']} of {total['blends'] + total['saved']} blends"
     )
-    return df_attr
+    return total
+
+
+def generate_images(
+    df_csv: pd.DataFrame,
+    amount: int,
+    save_folder: str = "./images",
+    start_id: int = 0,
+    workers: int = WORKERS,
+    chunk_size: int = CHUNK_SIZE,
+    resume: bool = False,
+    seed: int | None = SEED,
+) -> int:
+    """
+    generate images main function, plan all attributes then render them in parallel
+
+    Args:
+        df_csv (pd.DataFrame): source dataframe to use
+        amount (int): image amount to generate
+        save_folder (str, optional): images save folder. Defaults to "./images".
+        start_id (int, optional): which index start. Defaults to 0.
+        workers (int, optional): render processes, 0 uses cpu_count() - 1. Defaults to WORKERS.
+        chunk_size (int, optional): planned tokens per chunk. Defaults to CHUNK_SIZE.
+        resume (bool, optional): reuse an existing plan and render only what is missing. Defaults to False.
+        seed (int, optional): collection seed, None for fresh entropy. Defaults to SEED.
+
+    Returns:
+        int: amount of images rendered, attributes are saved to attr.csv
+    """
+    if resume and os.path.exists(PLAN):
+        return render_images(PLAN, save_folder, workers, chunk_size, resume)
+    assert (
+        len(list_images(save_folder)) == 0
+    ), f"{save_folder} folder is not empty, backup the original data and tables first"
+    plan_images(df_csv, amount, save_folder, start_id, seed=seed)
+    return render_images(PLAN, save_folder, workers, chunk_size)
 
 
 def check_values_valid(df: pd.DataFrame, select_columns: list, all_values: list):
@@ -325,6 +995,7 @@ def check_values_valid(df: pd.DataFrame, select_columns: list, all_values: list)
     Raises:
         ValueError: if data invalid (is not in all_values)
     """
+    df_group, props = tables()["df_group"], tables()["props"]
     values_to_check_df = df[list(select_columns)]
     all_values = list(df_group.index.levels[2])
     # loop rows if the value is not in the all_values, raise error
@@ -336,82 +1007,244 @@ def check_values_valid(df: pd.DataFrame, select_columns: list, all_values: list)
                 )
 
 
-def generate_images_from_attr_csv(csv_path: str):
+def generate_images_from_attr_csv(
+    csv_path: str,
+    workers: int = WORKERS,
+    chunk_size: int = CHUNK_SIZE,
+    rows: list[int] | None = None,
+    token_ids: list[str] | None = None,
+) -> int:
     """
     This function use for modify same images already generated
     You should use attr.csv in images folder as csv_path
-    Change some value in csv then run this function
+    Change some value in csv then run this function, images are rendered in parallel like the render stage.
+    With rows or token_ids only those images are rendered again, other images are kept
 
     Args:
         csv_path (str): use attr.csv in images folder
+        workers (int, optional): render processes, 0 uses cpu_count() - 1. Defaults to WORKERS.
+        chunk_size (int, optional): rows per chunk. Defaults to CHUNK_SIZE.
+        rows (list[int], optional): csv rows to render, from 0 and header excluded. Defaults to None.
+        token_ids (list[str], optional): token ids to render. Defaults to None.
+
+    Raises:
+        ValueError: if values are invalid, or rows or token_ids are not in the csv
+
+    Returns:
+        int: amount of images rendered, attr.csv in save_folder has every csv row in csv order
     """
-    modified_csv = pd.read_csv(csv_path)
+    df_group, props = tables()["df_group"], tables()["props"]
+    modified_csv = read_table(
+        csv_path, categories=list(props), dtype=str, keep_default_na=False
+    )
     all_values = list(df_group.index.levels[2])
     check_values_valid(modified_csv, props, all_values)
-    df_batch = pd.DataFrame()
-    assert (
-        len(list(filter(lambda f: f.split(".")[1] == "png", os.listdir(save_folder))))
-        == 0
-    ), f"{save_folder} folder is not empty, backup the original data and tables first"
+    df_attr = infer_folders(modified_csv)
+    if "path" in df_attr.columns:
+        ids = [os.path.basename(path).split("-")[0] for path in df_attr["path"]]
+    else:
+        ids = [str(i) for i in range(len(df_attr))]
+    old_paths = list(df_attr.get("path", [""] * len(df_attr)))
+    df_attr["path"] = [
+        os.path.join(save_folder, f"{token_id}-{'-'.join(values)}.{IMAGE_EXTENSION}")
+        for token_id, *values in zip(ids, *[df_attr[prop] for prop in props])
+    ]
+    attr_path = os.path.join(save_folder, "attr.csv")
+    workers = pool_size(workers)
+    unknown_rows = sorted(set(rows or []) - set(range(len(df_attr))))
+    if unknown_rows:
+        raise ValueError(
+            f"rows {unknown_rows} are not in {csv_path}, it has {len(df_attr)} rows"
+        )
+    unknown_tokens = sorted(set(token_ids or []) - set(ids), key=int)
+    if unknown_tokens:
+        raise ValueError(f"tokens {unknown_tokens} are not in {csv_path}")
 
-    # loop modified_csv and generate images
-    for index, row in modified_csv.iterrows():
-        attributes = []
-        base_img = Image.new("RGB", (W, H), (0, 0, 0))
-        for prop_index, prop in enumerate(props):
-            for folder in FOLDERS:
-                for ext in EXTENSION:
-                    path = os.path.join(
-                        ROOT_DIR,
-                        folder,
-                        f"0{prop_index+1}_{prop}",
-                        f"{row[prop]}.{ext}",
-                    )
+    if rows is None and token_ids is None:
+        assert (
+            len(list_images(save_folder)) == 0
+        ), f"{save_folder} folder is not empty, backup the original data and tables first"
+        if len(df_attr) == 0:
+            print(f"{csv_path} has no rows to render")
+            return 0
+        # journal aside, csv_path is usually this attr.csv and keeps the edits until done
+        with Journal(attr_path + ".tmp", ["path", *props]) as journal:
+            render_rows(sort_by_layers(df_attr), workers, chunk_size, journal)
+        sort_attr_csv(attr_path + ".tmp", list(df_attr["path"]))
+        os.replace(attr_path + ".tmp", attr_path)
+        record_attr_tokens(df_attr, df_attr.index)
+        return len(df_attr)
 
-                    if os.path.exists(path):
-                        img = Image.open(path, "r")
-                        if not has_transparency(img):
-                            img = img.convert("RGBA")
-                        base_img.paste(img, (0, 0), mask=img)
-                        if (
-                            prop_index,
-                            row[prop],
-                        ) not in attributes:
-                            attributes.append((prop_index, row[prop]))
-        # save images
-        filename = f"{index}-{'-'.join(map(lambda t: t[1],attributes))}.png"
-        save_path = os.path.join(save_folder, filename)
-        base_img.save(save_path, format="jpeg", quality=QUALITY)
-        # add porpety
-        row_dict = {"path": save_path} | {prop: row[prop] for prop in props}
-        new_row_df = pd.DataFrame.from_dict(row_dict, orient="index").T
-        df_batch = pd.concat(
-            [df_batch, new_row_df],
-            ignore_index=True,
-        )
+    selected = set(rows or []) | set(
+        i for i, token_id in enumerate(ids) if token_id in set(token_ids or [])
+    )
+    df_selected = df_attr.iloc[sorted(selected)]
+    if len(df_selected):
+        render_rows(sort_by_layers(df_selected), workers, chunk_size)
+    for i in selected:
+        # values in the file name changed, remove the image rendered before
+        if old_paths[i] != df_attr["path"].iloc[i] and os.path.exists(old_paths[i]):
+            os.remove(old_paths[i])
+    with Journal(attr_path + ".tmp", ["path", *props]) as journal:
+        journal.append(df_attr[["path", *props]].values.tolist())
+    os.replace(attr_path + ".tmp", attr_path)
+    record_attr_tokens(df_attr, df_selected.index)
+    return len(df_selected)
 
-    df_batch.to_csv(os.path.join(save_folder, "attr.csv"), index=False)
 
+def record_attr_tokens(df_attr: pd.DataFrame, rendered_index: pd.Index):
+    """
+    save the tokens of a modified attr.csv to the project state
 
-df_csv = pd.read_csv("./ratio.csv")
-df_group = df_csv.groupby(["folder", "prop", "value"]).apply(get_ratio).to_frame()
-df_pac = (
-    df_group.groupby(level=["folder", "prop"])
-    .apply(lambda x: x / float(x.sum()))
-    .rename(columns={0: "ratio"})
-    .sort_values(by=["ratio"], ascending=[True])
-)
-props = df_csv["prop"].unique()
-used_attributes = {}
+    Args:
+        df_attr (pd.DataFrame): rows with path, folder and props columns
+        rendered_index (pd.Index): rows rendered again, their CIDs are dropped
+    """
+    props = tables()["props"]
+    record_tokens(
+        [
+            (path, folder, values)
+            for path, folder, *values in df_attr[["path", "folder", *props]].itertuples(
+                index=False, name=None
+            )
+        ],
+        rendered=True,
+    )
+    forget_uploads(
+        [os.path.basename(path) for path in df_attr.loc[rendered_index, "path"]]
+    )
+    record_stage("attr", f"{len(rendered_index)} images rendered")
+
+
+def parse_ids(text: str) -> list[int]:
+    """
+    parse ids like "1,5,10-20", ranges include both ends
+
+    Args:
+        text (str): comma separated ids and ranges
+
+    Returns:
+        list[int]: ids
+    """
+    ids = []
+    for part in text.split(","):
+        start, _, end = part.partition("-")
+        ids.extend(range(int(start), int(end or start) + 1))
+    return ids
+
+
+_tables: Tables | None = None
+sampling_stats = {"drawn": 0, "rejected": 0, "duplicate": 0}
+prefix_compositor: PrefixCompositor | None = None
+image_writer: ImageWriter | None = None
 save_folder: str = IMAGES
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="generate images")
+    parser.add_argument(
+        "stage",
+        nargs="?",
+        default="all",
+        choices=["all", "plan", "render", "merge", "update", "attr"],
+        help=f"plan writes attributes to {PLAN}, render draws images from it, all does both, merge combines rendered shards, update re-renders images using changed part files, attr renders images from a modified attr.csv",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=WORKERS,
+        help="render processes, 0 uses cpu_count() - 1",
+    )
+    parser.add_argument(
+        "--chunk-size", type=int, default=CHUNK_SIZE, help="planned tokens per chunk"
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="continue an interrupted run, keep complete images and render the rest",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=SEED,
+        help="same seed and tables give the same plan, attr.csv and images",
+    )
+    parser.add_argument(
+        "--shard",
+        type=lambda s: tuple(map(int, s.split("/"))),
+        help="i/N, render only the i-th (from 0) of N slices of the plan into its own folder",
+    )
+    parser.add_argument(
+        "--csv",
+        default=os.path.join(IMAGES, "attr.csv"),
+        help="modified attr.csv used by the attr stage",
+    )
+    parser.add_argument(
+        "--rows",
+        type=parse_ids,
+        help="attr stage renders only these csv rows, from 0, e.g. 0,5,10-20",
+    )
+    parser.add_argument(
+        "--tokens",
+        type=lambda s: [str(i) for i in parse_ids(s)],
+        help="attr stage renders only these token ids, e.g. 1,5,10-20",
+    )
+    args = parser.parse_args()
+    if args.shard is not None and args.stage != "render":
+        parser.error("--shard renders a planned manifest, use it with the render stage")
+    if args.stage == "update":
+        try:
+            token_ids = update_images(
+                os.path.join(save_folder, "attr.csv"),
+                LAYER_HASHES,
+                args.workers,
+                args.chunk_size,
+            )
+        except ValueError as e:
+            print(e)
+            exit(1)
+        print(
+            f"{len(token_ids)} images re-rendered, upload them again: {' '.join(token_ids)}"
+        )
+        exit()
+    if args.stage == "attr":
+        try:
+            amount = generate_images_from_attr_csv(
+                args.csv, args.workers, args.chunk_size, args.rows, args.tokens
+            )
+        except ValueError as e:
+            print(e)
+            exit(1)
+        print(f"render {amount} images from {args.csv} to {save_folder} success")
+        exit()
+    if args.stage == "merge":
+        amount = merge_shards(PLAN, save_folder)
+        print(f"merge {amount} images to {save_folder} success")
+        exit()
+    if args.stage == "plan":
+        plan_images(tables()["df_csv"], AMOUNT, save_folder, START_ID, seed=args.seed)
+        print(f"plan {AMOUNT} images to {PLAN} success")
+        exit()
+
     print(f"generating/... check images in {save_folder} folder")
-    print(f"quality is {QUALITY}")
+    print(f"format is {OUTPUT_FORMAT}, quality is {QUALITY}")
     print("PS: you can press Ctrl+C to stop the process")
-    generate_images(df_csv, AMOUNT, start_id=START_ID)
-    print(f"generate {AMOUNT} images in {save_folder} folder success")
+    if args.stage == "render":
+        render_images(
+            PLAN, save_folder, args.workers, args.chunk_size, args.resume, args.shard
+        )
+    else:
+        generate_images(
+            tables()["df_csv"],
+            AMOUNT,
+            save_folder,
+            START_ID,
+            args.workers,
+            args.chunk_size,
+            args.resume,
+            args.seed,
+        )
+    print(f"generate images in {save_folder} folder success")
 
-    # if you want to modify images already generated, use this function
-    # generate_images_from_attr_csv('images/attr.csv')
+    # if you want to modify images already generated, edit attr.csv and run
+    # python src/generate.py attr --tokens 1,5,10-20
@@ -1,8 +1,12 @@
+import hashlib
 import os
 from PIL import Image
 import pandas as pd
 import shutil
-from config import FOLDERS, EXTENSION, W, H, WEIGHTS, LAYER_NAMES
+from pathlib import Path
+from config import FOLDERS, W, H, WEIGHTS, LAYER_NAMES, EXTENSION
+from validate import validate_layers
+from state import record_parts, record_stage, read_parts
 from math import fsum
 
 
@@ -34,9 +38,73 @@ def get_files_path(folders=FOLDERS):
     return files_path
 
 
-files_path = get_files_path()
+def build_layer_index(
+    files_path: list[str],
+) -> tuple[dict[tuple[str, str, str], str], list[str]]:
+    """
+    helper function to index source layer files by (folder, prop, value)
+
+    Args:
+        files_path (list[str]): source layer files path from get_files_path, files without an EXTENSION are skipped
+
+    Raises:
+        ValueError: if two files have the same value, like A.png and A.PNG
+
+    Returns:
+        tuple[dict[tuple[str, str, str], str], list[str]]: ({(folder, prop, value): path}, layer subfolders in overlay order)
+    """
+    layer_index = {}
+    layer_order = set()
+    for path in files_path:
+        if path.split(".")[-1] not in EXTENSION:
+            continue
+        folder, subfolder = path.split(os.sep)[:2]
+        key = (folder, subfolder.split("_")[1], Path(path).stem)
+        if key in layer_index:
+            raise ValueError(f"{layer_index[key]} and {path} are the same value")
+        layer_index[key] = path
+        layer_order.add(subfolder)
+    return layer_index, sorted(layer_order)
+
+
+def hash_files(files_path: list[str]) -> dict[str, str]:
+    """
+    helper function to get content hash of source layer files
+
+    Args:
+        files_path (list[str]): source layer files path
+
+    Returns:
+        dict[str, str]: {path: sha256 hex digest}
+    """
+    hashes = {}
+    for path in files_path:
+        with open(path, "rb") as f:
+            hashes[path] = hashlib.sha256(f.read()).hexdigest()
+    return hashes
+
+
+def part_layers() -> tuple[list[str], dict[tuple[str, str, str], str], list[str]]:
+    """
+    part files of FOLDERS, read from the project state written by the table stage
+    (walked if a folder is not indexed yet) on first use and kept for the process
+
+    Returns:
+        tuple[list[str], dict[tuple[str, str, str], str], list[str]]: (files_path, layer_index, layer_order), see build_layer_index
+    """
+    global _layers
+    if _layers is None:
+        files_path = read_parts(FOLDERS) or get_files_path()
+        _layers = (files_path, *build_layer_index(files_path))
+    return _layers
+
+
+_layers: tuple[list[str], dict[tuple[str, str, str], str], list[str]] | None = None
 
 if __name__ == "__main__":
+    # the table stage indexes the folders, so it always walks them
+    files_path = get_files_path()
+    _, layer_order = build_layer_index(files_path)
     # clean old folder
     folders = ["images", "metadata"]
     for folder in folders:
@@ -50,23 +118,22 @@ if __name__ == "__main__":
         fsum(WEIGHTS) == 1
     ), f"sum of PARTS_DICT's value in config.py should be 1, now is {sum(WEIGHTS)}"
 
-    # Validate image format and size
+    # Validate image format, size, mode and decoding
+    facts = validate_layers(files_path)
     error = 0
     for path in files_path:
-        try:
-            assert (
-                path.split(".")[-1] in EXTENSION
-            ), f"{path}'s extension is not {EXTENSION} "
-            im = Image.open(path)
-            w, h = im.size
-            assert w == W, f"{path} width not equal {W}"
-            assert h == H, f"{path} height not equal {H}"
-        except Exception as e:
-            print(e)
+        if facts[path]["error"]:
+            print(facts[path]["error"])
             error += 1
     if error != 0:
         print(f"{error} images have error, fix and try again")
         exit()
+    # an opaque layer above the bottom one hides every layer beneath it
+    for path in files_path:
+        if facts[path]["opaque"] and path.split(os.sep)[1] != layer_order[0]:
+            print(
+                f"warning: {path} has no transparent pixel, layers beneath it are hidden"
+            )
 
     # Validate path name has -
     for path in files_path:
@@ -130,6 +197,9 @@ if __name__ == "__main__":
             os.mkdir(folder_to_create)
             shutil.copy("empty.png", folder_to_create)
             attrs.append((folder_to_create, "empty.png"))
+    # index the filled empty.png files with the others, facts of the rest are cached
+    files_path = get_files_path()
+    record_parts(validate_layers(files_path))
 
     ratio_data = {
         "folder": [a[0].split(os.sep)[0] for a in attrs],
@@ -164,6 +234,7 @@ if __name__ == "__main__":
     print("set your rules in rules.csv")
     print("-------------------")
     if os.path.exists("ratio.csv"):
+        record_stage("table", f"{len(files_path)} part files")
         print("generate table success!")
         print("You can modify ratio.csv to change the ratio of each parts")
         print("PS: Don't use Excel to save csv, use notepad instead")
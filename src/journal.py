@@ -0,0 +1,106 @@
+import csv
+import os
+import time
+from PIL import Image
+from config import JOURNAL_FSYNC_SECONDS
+
+
+class Journal:
+    """
+    append-only csv of completed tokens, attr.csv is the journal of the render stage
+
+    Rows are appended only after their images are on disk and the file is fsynced
+    at most every fsync_seconds, so after a crash every row older than that is
+    durable and a half written last line is the only possible damage.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        header: list[str] | None = None,
+        fsync_seconds: float = JOURNAL_FSYNC_SECONDS,
+    ):
+        """
+        Args:
+            path (str): journal path
+            header (list[str], optional): column names, the file is truncated and the header written when given. Defaults to None.
+            fsync_seconds (float, optional): min seconds between fsyncs, 0 syncs on every append. Defaults to JOURNAL_FSYNC_SECONDS.
+        """
+        self.fsync_seconds = fsync_seconds
+        self.file = open(path, "w" if header else "a", newline="", encoding="utf-8")
+        self.writer = csv.writer(self.file)
+        self.last_sync = time.monotonic()
+        if header:
+            self.writer.writerow(header)
+            self.sync()
+
+    def append(self, rows: list[list[str]]):
+        """
+        append completed rows, fsync when the last sync is older than fsync_seconds
+
+        Args:
+            rows (list[list[str]]): [path, *values] rows
+        """
+        self.writer.writerows(rows)
+        if time.monotonic() - self.last_sync >= self.fsync_seconds:
+            self.sync()
+
+    def sync(self):
+        """
+        flush and fsync the journal
+        """
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.last_sync = time.monotonic()
+
+    def close(self):
+        """
+        sync and close the journal
+        """
+        if not self.file.closed:
+            self.sync()
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_journal(path: str, columns: int) -> list[list[str]]:
+    """
+    read rows of a journal, a line cut by a crash is dropped
+
+    Args:
+        path (str): journal path
+        columns (int): columns of a complete row
+
+    Returns:
+        list[list[str]]: rows without header
+    """
+    if not os.path.exists(path):
+        return []
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = list(csv.reader(f))
+    return [row for row in rows[1:] if len(row) == columns]
+
+
+def is_complete_image(path: str) -> bool:
+    """
+    check an image on disk is not empty and fully decodes
+
+    Args:
+        path (str): image path
+
+    Returns:
+        bool: True if the image can be used as is
+    """
+    try:
+        if os.path.getsize(path) == 0:
+            return False
+        with Image.open(path) as img:
+            img.load()
+        return True
+    except (OSError, SyntaxError, ValueError):
+        return False
@@ -0,0 +1,57 @@
+import argparse
+import os
+import runpy
+import sys
+from config import STATE
+from state import read_status, print_status
+
+# subcommand: (stage script in src, help)
+COMMANDS = {
+    "table": ("get_table.py", "check part files, write ratio.csv and rules.csv"),
+    "capacity": ("capacity.py", "count rule-valid combinations"),
+    "generate": (
+        "generate.py",
+        "plan and render images, takes generate.py arguments, e.g. render --resume",
+    ),
+    "check": ("final_check.py", "remove duplicates, rename images, show ratios"),
+    "mystery-box": ("upload_mystery_box.py", "upload mystery box metadata"),
+    "upload": ("upload.py", "upload images, generate and upload metadata"),
+    "refresh": ("fresh_metadata.py", "refresh opensea metadata"),
+    "benchmark": ("benchmark.py", "takes benchmark.py arguments, e.g. startup"),
+}
+
+
+def run_stage(command: str, args: list[str]):
+    """
+    run a stage script in this process, same as starting it from the command line
+
+    Args:
+        command (str): key of COMMANDS
+        args (list[str]): command line arguments of the script
+    """
+    script = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), COMMANDS[command][0]
+    )
+    sys.argv = [script, *args]
+    runpy.run_path(script, run_name="__main__")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="run the pipeline stages, their progress is kept in the project state"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for command, (_, help) in COMMANDS.items():
+        # arguments are left to the stage script
+        subparsers.add_parser(command, help=help, add_help=False)
+    status_parser = subparsers.add_parser(
+        "status", help="show parts, tokens and finished stages from the project state"
+    )
+    status_parser.add_argument("--state", default=STATE, help="sqlite state path")
+    args, stage_args = parser.parse_known_args()
+    if args.command == "status":
+        if stage_args:
+            parser.error(f"unrecognized arguments: {' '.join(stage_args)}")
+        print_status(read_status(args.state))
+    else:
+        run_stage(args.command, stage_args)
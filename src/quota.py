@@ -0,0 +1,365 @@
+import itertools
+import numpy as np
+from sampler import CompiledSampler
+from rules import CompiledRules
+from capacity import OTHER, folder_components, marginals, value_capacity
+
+TRIES = 8  # partners a bad row tries in each round of plan_quota
+TAIL_ROWS = 256  # most bad rows plan_quota repairs one at a time after rounds stall
+
+
+def largest_remainder(total: int, weights) -> np.ndarray:
+    """
+    split total into integer counts proportional to weights, floors first then
+    the largest fractional parts get the remaining units
+
+    Args:
+        total (int): amount to split
+        weights (Sequence[float]): non negative weights
+
+    Returns:
+        np.ndarray: counts summing to total, all zero if weights are all zero
+    """
+    weights = np.asarray(weights, dtype=float)
+    if weights.sum() <= 0:
+        return np.zeros(len(weights), dtype=np.int64)
+    exact = weights / weights.sum() * total
+    counts = np.floor(exact).astype(np.int64)
+    order = np.argsort(-(exact - counts), kind="stable")
+    counts[order[: total - counts.sum()]] += 1
+    return counts
+
+
+def capped_remainder(total: int, weights, caps) -> np.ndarray:
+    """
+    largest_remainder where no count exceeds its cap, the share of capped values
+    goes to the others in proportion to their weights
+
+    Args:
+        total (int): amount to split
+        weights (Sequence[float]): non negative weights
+        caps (Sequence[int]): max count of each weight
+
+    Returns:
+        np.ndarray: counts summing to total
+
+    Raises:
+        ValueError: if caps sum to less than total
+    """
+    weights = np.asarray(weights, dtype=float)
+    caps = np.asarray(caps, dtype=object)
+    capped = np.zeros(len(weights), dtype=bool)
+    while True:
+        counts = np.zeros(len(weights), dtype=np.int64)
+        counts[capped] = caps[capped]
+        free = ~capped & (caps > 0)
+        # values with zero ratio only fill what capped values leave over
+        share = np.where(free, weights, 0)
+        if share.sum() <= 0:
+            share = free.astype(float)
+        if share.sum() <= 0 and total > counts.sum():
+            raise ValueError("not enough rule-valid combinations to meet quotas")
+        counts += largest_remainder(int(total - counts.sum()), share)
+        over = ~capped & (counts > caps)
+        if not over.any():
+            return counts
+        capped |= over
+
+
+def allocate_quotas(
+    sampler: CompiledSampler,
+    rules: CompiledRules,
+    amount: int,
+    components: list[list[dict | None]] | None = None,
+) -> tuple[np.ndarray, list[list[np.ndarray]]]:
+    """
+    exact counts of every folder and every value of a plan, folders are split by
+    PARTS_DICT weights and values by their share among rule-valid combinations,
+    which is the ratio itself for values no requirement forces or excludes.
+    A value is never planned more often than the unique combinations containing it
+
+    Args:
+        sampler (CompiledSampler): compiled sampler
+        rules (CompiledRules): compiled rules
+        amount (int): images to plan
+        components (list[list[dict | None]], optional): folder_components of rules. Defaults to None.
+
+    Raises:
+        ValueError: if a folder has less rule-valid combinations than its images
+
+    Returns:
+        tuple[np.ndarray, list[list[np.ndarray]]]: (images of each folder, count of each value in sampler.codes[f][p] order)
+    """
+    folder_counts = largest_remainder(
+        amount, np.diff(np.concatenate([[0.0], sampler.folder_cum]))
+    )
+    value_counts = []
+    if components is None:
+        components = folder_components(rules)
+    for f, folder in enumerate(components):
+        shares = sampler.weights[f]
+        if all(c is not None for c in folder):
+            combinations = np.prod([c["combinations"] for c in folder], dtype=object)
+            if folder_counts[f] > combinations:
+                raise ValueError(
+                    f"{sampler.folders[f]} has {combinations} rule-valid combinations, "
+                    f"less than its {folder_counts[f]} images, reduce the amount or its weight"
+                )
+            probs = marginals(sampler, folder)  # type: ignore
+            caps = value_capacity(sampler, folder)  # type: ignore
+            value_counts.append(
+                [
+                    capped_remainder(
+                        int(folder_counts[f]), probs[p][codes], caps[p][codes]
+                    )
+                    for p, codes in enumerate(sampler.codes[f])
+                ]
+            )
+            continue
+        value_counts.append(
+            [largest_remainder(int(folder_counts[f]), weights) for weights in shares]
+        )
+    return folder_counts, value_counts
+
+
+def expand(component: dict, outputs: np.ndarray) -> np.ndarray:
+    """
+    every combination of values a group of props can take from some of its outputs,
+    OTHER cells become each value they stand for
+
+    Args:
+        component (dict): group from count_component
+        outputs (np.ndarray): outputs of the group with shape (k, group props)
+
+    Returns:
+        np.ndarray: codes with shape (n, group props)
+    """
+    rows = [
+        combination
+        for out in outputs
+        for combination in itertools.product(
+            *(
+                component["other_codes"][i] if code == OTHER else [code]
+                for i, code in enumerate(out)
+            )
+        )
+    ]
+    return np.array(rows, dtype=np.int32).reshape(len(rows), len(component["props"]))
+
+
+def saturated_rows(
+    sampler: CompiledSampler,
+    folder_index: int,
+    components: list[dict],
+    counts: list[np.ndarray],
+) -> np.ndarray:
+    """
+    rows every plan meeting counts must contain, a value whose count equals the
+    rule-valid combinations containing it needs all of them
+
+    Args:
+        sampler (CompiledSampler): compiled sampler
+        folder_index (int): index of folder in folders
+        components (list[dict]): components of the folder from folder_components
+        counts (list[np.ndarray]): count of each value in sampler.codes[f][p] order
+
+    Returns:
+        np.ndarray: unique codes with shape (n, props)
+    """
+    n_props = len(sampler.props)
+    caps = value_capacity(sampler, components)
+    blocks = []
+    for c in components:
+        for i, p in enumerate(c["props"]):
+            codes = sampler.codes[folder_index][p]
+            for code in codes[(counts[p] > 0) & (counts[p] >= caps[p][codes])]:
+                column = c["outputs"][:, i]
+                own = expand(
+                    c,
+                    c["outputs"][
+                        (column == code)
+                        | ((column == OTHER) & np.isin(code, c["other_codes"][i]))
+                    ],
+                )
+                parts = [(c["props"], own[own[:, i] == code])] + [
+                    (o["props"], expand(o, o["outputs"]))
+                    for o in components
+                    if o is not c
+                ]
+                rows = np.zeros((1, n_props), dtype=np.int32)
+                for props, part in parts:
+                    rows = np.repeat(rows, len(part), axis=0)
+                    rows[:, props] = np.tile(part, (len(rows) // max(len(part), 1), 1))
+                blocks.append(rows)
+    if not blocks:
+        return np.empty((0, n_props), dtype=np.int32)
+    return np.unique(np.concatenate(blocks), axis=0)
+
+
+def plan_quota(
+    sampler: CompiledSampler,
+    rules: CompiledRules,
+    amount: int,
+    rng: np.random.Generator,
+    max_attempts: int = 200,
+) -> tuple[np.ndarray, np.ndarray, int]:
+    """
+    plan unique rule-valid combinations which meet the quotas of allocate_quotas exactly.
+    Rows of saturated_rows are placed as they are, the other rows of a folder get
+    each prop column filled with what is left of its quota and shuffled. Then in rounds
+    every row breaking a rule or repeating another row swaps the value of a prop
+    with another row of the same folder. A swap keeps every quota, it is kept unless
+    it leaves more bad rows among the two
+
+    Args:
+        sampler (CompiledSampler): compiled sampler
+        rules (CompiledRules): compiled rules
+        amount (int): images to plan
+        rng (np.random.Generator): random generator
+        max_attempts (int, optional): one at a time swap attempts allowed per bad row the rounds leave. Defaults to 200.
+
+    Raises:
+        ValueError: if the quotas can't be met under rules.csv with unique combinations
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, int]: (folder indexes with shape (amount,), value codes with shape (amount, props), swaps made)
+    """
+    n_props = len(sampler.props)
+    components = folder_components(rules)
+    folder_counts, value_counts = allocate_quotas(sampler, rules, amount, components)
+    folder_idx = np.repeat(np.arange(len(folder_counts)), folder_counts)
+    codes = np.empty((amount, n_props), dtype=np.int32)
+    starts = np.concatenate([[0], np.cumsum(folder_counts)])
+    # saturated values leave no choice, their rows go first and are never swapped
+    free_starts, free_counts = starts[:-1].copy(), folder_counts.copy()
+    for f, folder in enumerate(components):
+        fixed = (
+            saturated_rows(sampler, f, folder, value_counts[f])  # type: ignore
+            if all(c is not None for c in folder)
+            else np.empty((0, n_props), dtype=np.int32)
+        )
+        left = [
+            value_counts[f][p]
+            - np.bincount(fixed[:, p], minlength=len(sampler.values[p]))[folder_codes]
+            for p, folder_codes in enumerate(sampler.codes[f])
+        ]
+        if len(fixed) > folder_counts[f] or any((counts < 0).any() for counts in left):
+            raise ValueError(
+                f"values of {sampler.folders[f]} which need all their combinations "
+                "exceed quotas, adjust ratios or rules"
+            )
+        codes[starts[f] : starts[f] + len(fixed)] = fixed
+        free_starts[f] += len(fixed)
+        free_counts[f] -= len(fixed)
+        for p in range(n_props):
+            column = np.repeat(sampler.codes[f][p], left[p])
+            codes[free_starts[f] : starts[f + 1], p] = rng.permutation(column)
+
+    # random 64 bit hash of rows, equal rows always collide, a false collision
+    # only costs an extra swap
+    mult = rng.integers(1, 2**63, size=n_props + 1, dtype=np.uint64) | np.uint64(1)
+    with np.errstate(over="ignore"):
+        keys = (codes.astype(np.uint64) * mult[1:]).sum(
+            axis=1, dtype=np.uint64
+        ) + folder_idx.astype(np.uint64) * mult[0]
+    seen: dict[int, int] = {}
+    for key in keys.tolist():
+        seen[key] = seen.get(key, 0) + 1
+
+    def bad(row_codes: np.ndarray, row_keys: np.ndarray) -> np.ndarray:
+        repeated = np.fromiter(
+            (seen.get(k, 0) > 1 for k in row_keys.tolist()),
+            dtype=bool,
+            count=len(row_keys),
+        )
+        return repeated | ~rules.satisfied(row_codes)
+
+    def move(old_keys: np.ndarray, new_keys: np.ndarray):
+        for old, new in zip(old_keys.tolist(), new_keys.tolist()):
+            seen[old] -= 1
+            seen[new] = seen.get(new, 0) + 1
+
+    def swap(i: np.ndarray, j: np.ndarray, p: np.ndarray):
+        new_i, new_j = codes[i].copy(), codes[j].copy()
+        rows = np.arange(len(i))
+        new_i[rows, p], new_j[rows, p] = codes[j, p], codes[i, p]
+        delta = (codes[j, p].astype(np.int64) - codes[i, p]).astype(np.uint64)
+        with np.errstate(over="ignore"):
+            delta *= mult[p + 1]
+            return new_i, new_j, keys[i] + delta, keys[j] - delta
+
+    def propose(bad_rows: np.ndarray):
+        # every bad row tries a few partners and takes the first one which
+        # would leave it unique and valid
+        i = np.repeat(bad_rows, TRIES)
+        f = folder_idx[i]
+        j = free_starts[f] + (rng.random(len(i)) * free_counts[f]).astype(np.int64)
+        p = rng.integers(n_props, size=len(i))
+        new_i, _, keys_i, _ = swap(i, j, p)
+        unused = np.fromiter(
+            (seen.get(k, 0) == 0 for k in keys_i.tolist()), dtype=bool, count=len(i)
+        )
+        fits = (unused & rules.satisfied(new_i)).reshape(-1, TRIES)
+        pick = np.arange(len(bad_rows)) * TRIES + fits.argmax(axis=1)
+        i, j, p = i[pick], j[pick], p[pick]
+        differ = codes[i, p] != codes[j, p]
+        return i[differ], j[differ], p[differ]
+
+    def try_swaps(i: np.ndarray, j: np.ndarray, p: np.ndarray) -> np.ndarray:
+        # keep a swap unless its two rows end with more bad rows than before
+        before = 1 + bad(codes[j], keys[j]).astype(int)
+        new_i, new_j, keys_i, keys_j = swap(i, j, p)
+        move(np.concatenate([keys[i], keys[j]]), np.concatenate([keys_i, keys_j]))
+        bad_j = bad(new_j, keys_j)
+        keep = bad(new_i, keys_i).astype(int) + bad_j <= before
+        move(
+            np.concatenate([keys_i[~keep], keys_j[~keep]]),
+            np.concatenate([keys[i][~keep], keys[j][~keep]]),
+        )
+        codes[i[keep]], codes[j[keep]] = new_i[keep], new_j[keep]
+        keys[i[keep]], keys[j[keep]] = keys_i[keep], keys_j[keep]
+        return keep
+
+    swaps, stall, best = 0, 0, amount + 1
+    free = np.arange(amount) >= free_starts[folder_idx]
+    bad_rows = np.flatnonzero(bad(codes, keys) & free)
+    # swaps of one round can't see each other, so rounds stop once they stall
+    # and the last rows are repaired one swap at a time
+    while stall < 10 and len(bad_rows) > 16:
+        i, j, p = propose(bad_rows)
+        # a row takes part in one swap per round
+        rows, counts = np.unique(np.concatenate([i, j]), return_counts=True)
+        once = np.isin(i, rows[counts == 1]) & np.isin(j, rows[counts == 1])
+        keep = try_swaps(i[once], j[once], p[once])
+        swaps += int(keep.sum())
+        # rows of rejected swaps go back to keys other swaps may have taken
+        candidates = np.unique(np.concatenate([bad_rows, j[once]]))
+        bad_rows = candidates[bad(codes[candidates], keys[candidates])]
+        if len(bad_rows) < best:
+            best, stall = len(bad_rows), 0
+        else:
+            stall += 1
+
+    if len(bad_rows) > TAIL_ROWS:
+        raise ValueError(
+            f"{len(bad_rows)} images can't meet quotas under rules.csv, adjust ratios or rules"
+        )
+    pending = bad_rows.tolist()
+    attempts, limit = 0, max_attempts * (len(pending) + 1)
+    while pending:
+        i = np.array(pending[-1:])
+        if not bad(codes[i], keys[i])[0]:
+            pending.pop()
+            continue
+        attempts += 1
+        if attempts > limit:
+            raise ValueError(
+                f"{len(pending)} images can't meet quotas under rules.csv, adjust ratios or rules"
+            )
+        i, j, p = propose(i)
+        if len(i) and try_swaps(i, j, p)[0]:
+            swaps += 1
+            if bad(codes[j], keys[j])[0]:
+                pending.append(int(j[0]))
+    order = rng.permutation(amount)
+    return folder_idx[order], codes[order], swaps
@@ -0,0 +1,388 @@
+from collections import OrderedDict
+from typing import Callable
+import numpy as np
+from PIL import Image
+from validate import layer_facts
+from config import LAYER_CACHE_MB, PREFIX_CACHE_MB, COMPOSITOR, Compositor, W, H
+
+
+def has_transparency(img):
+    if img.info.get("transparency", None) is not None:
+        return True
+    if img.mode == "P":
+        transparent = img.info.get("transparency", -1)
+        for _, index in img.getcolors():
+            if index == transparent:
+                return True
+    elif img.mode == "RGBA":
+        extrema = img.getextrema()
+        if extrema[3][0] < 255:
+            return True
+
+    return False
+
+
+def load_pil_layer(path: str) -> tuple[Image.Image | None, bool, tuple[int, int]]:
+    """
+    decode a layer for the PIL compositor cropped to the bounding box of its
+    visible pixels, pixels outside it never change the canvas. Transparency and
+    the bounding box come from the facts of get_table.py when they are fresh
+
+    Args:
+        path (str): layer file path
+
+    Returns:
+        tuple[Image.Image | None, bool, tuple[int, int]]: (cropped RGBA image, has transparency, (left, top) offset), image is None for a fully transparent layer
+    """
+    facts = layer_facts(path)
+    with Image.open(path, "r") as img:
+        transparent = facts["transparent"] if facts else has_transparency(img)
+        rgba = img.convert("RGBA")
+    bbox = facts["bbox"] if facts else rgba.getchannel("A").getbbox()
+    if bbox is None:
+        return None, transparent, (0, 0)
+    if tuple(bbox) != (0, 0, rgba.width, rgba.height):
+        rgba = rgba.crop(tuple(bbox))
+    return rgba, transparent, (bbox[0], bbox[1])
+
+
+def load_array_layer(
+    path: str,
+) -> tuple[np.ndarray | None, np.ndarray | None, tuple[int, int]]:
+    """
+    decode a layer for the NumPy compositor cropped like load_pil_layer
+
+    Args:
+        path (str): layer file path
+
+    Returns:
+        tuple[np.ndarray | None, np.ndarray | None, tuple[int, int]]: (uint16 RGB premultiplied by alpha plus 128, uint16 255 - alpha, (left, top) offset), an opaque crop is (uint8 RGB, None, offset) and a fully transparent layer (None, None, offset)
+    """
+    img, _, offset = load_pil_layer(path)
+    if img is None:
+        return None, None, offset
+    rgba = np.asarray(img)
+    if rgba[:, :, 3].min() == 255:
+        return np.ascontiguousarray(rgba[:, :, :3]), None, offset
+    alpha = rgba[:, :, 3:].astype(np.uint16)
+    return rgba[:, :, :3] * alpha + 128, np.repeat(255 - alpha, 3, axis=2), offset
+
+
+def layer_nbytes(item) -> int:
+    if item[0] is None:
+        return 0
+    if isinstance(item[0], Image.Image):
+        return item[0].width * item[0].height * 4
+    return sum(a.nbytes for a in item[:2] if a is not None)
+
+
+class LayerCache:
+    """
+    per-process LRU cache of decoded RGBA layers keyed by path
+
+    Each part file is decoded and scanned for transparency once per process instead
+    of once per token. Least recently used layers are evicted above max_bytes.
+    """
+
+    def __init__(self, max_bytes: int, loader: Callable = load_pil_layer):
+        """
+        Args:
+            max_bytes (int): memory bound of decoded layers
+            loader (Callable, optional): decode a path to a cached item. Defaults to load_pil_layer.
+        """
+        self.max_bytes = max_bytes
+        self.loader = loader
+        self.layers: OrderedDict[str, tuple] = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, path: str) -> tuple:
+        """
+        get a decoded layer
+
+        Args:
+            path (str): layer file path
+
+        Returns:
+            tuple: item of loader, (cropped RGBA image, has transparency, offset) for load_pil_layer
+        """
+        if path in self.layers:
+            self.hits += 1
+            self.layers.move_to_end(path)
+            return self.layers[path]
+        self.misses += 1
+        item = self.loader(path)
+        self.put(path, item)
+        return item
+
+    def put(self, path: str, item: tuple):
+        """
+        add a decoded layer, evict least recently used layers above the memory bound
+
+        Args:
+            path (str): layer file path
+            item (tuple): item of loader
+        """
+        size = layer_nbytes(item)
+        if size > self.max_bytes:
+            return
+        while self.layers and self.bytes + size > self.max_bytes:
+            _, evicted = self.layers.popitem(last=False)
+            self.bytes -= layer_nbytes(evicted)
+            self.evictions += 1
+        self.layers[path] = item
+        self.bytes += size
+
+    def warm(self, paths: list[str]):
+        """
+        decode layers ahead of rendering until the cache is full
+
+        Args:
+            paths (list[str]): layer file paths
+        """
+        for path in paths:
+            if path in self.layers:
+                continue
+            self.get(path)
+            if self.bytes >= self.max_bytes:
+                break
+
+    def stats(self) -> dict:
+        """
+        cache counters
+
+        Returns:
+            dict: hits, misses, evictions, layers, bytes
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "layers": len(self.layers),
+            "bytes": self.bytes,
+        }
+
+
+layer_cache = LayerCache(
+    LAYER_CACHE_MB * 1024 * 1024,
+    load_array_layer if COMPOSITOR == Compositor.numpy.value else load_pil_layer,
+)
+_canvas: np.ndarray | None = None
+_carry: np.ndarray | None = None
+
+
+def warm_layer_cache(paths: list[str]):
+    """
+    pool initializer, decode layers once in each worker before rendering
+
+    Args:
+        paths (list[str]): layer file paths
+    """
+    layer_cache.warm(paths)
+
+
+def print_layer_cache_stats(stats: dict | None = None):
+    """
+    print layer cache counters
+
+    Args:
+        stats (dict, optional): counters from LayerCache.stats, summed over workers. Defaults to counters of current process.
+    """
+    stats = layer_cache.stats() if stats is None else stats
+    print(
+        f"layer cache: {stats['hits']} hits, {stats['misses']} misses, "
+        f"{stats['evictions']} evictions, {stats['layers']} layers in {stats['bytes'] / 1024 / 1024:.1f}MB"
+    )
+
+
+def blend_pil(base_img: Image.Image, item: tuple):
+    """
+    paste a layer from load_pil_layer onto an RGB image in place
+
+    Args:
+        base_img (Image.Image): RGB image
+        item (tuple): (cropped RGBA image, has transparency, offset)
+    """
+    img, transparent, offset = item
+    if img is not None:
+        base_img.paste(img, offset, mask=img if transparent else None)
+
+
+def blend_array(canvas: np.ndarray, carry: np.ndarray, item: tuple):
+    """
+    blend a layer from load_array_layer onto the region of a uint16 canvas it covers, in place
+
+    Args:
+        canvas (np.ndarray): uint16 RGB canvas
+        carry (np.ndarray): uint16 scratch buffer with canvas shape
+        item (tuple): (premultiplied color, inverse alpha, offset)
+    """
+    color, inverse_alpha, (left, top) = item
+    if color is None:
+        return
+    height, width = color.shape[:2]
+    canvas = canvas[top : top + height, left : left + width]
+    carry = carry[top : top + height, left : left + width]
+    if inverse_alpha is None:
+        canvas[:] = color
+        return
+    # tmp = dst * (255 - a) + src * a + 128, out = ((tmp >> 8) + tmp) >> 8 like PIL's DIV255
+    np.multiply(canvas, inverse_alpha, out=canvas)
+    canvas += color
+    np.right_shift(canvas, 8, out=carry)
+    canvas += carry
+    canvas >>= 8
+
+
+def composite_pil(paths: list[str], cache: LayerCache | None = None) -> Image.Image:
+    """
+    stack layers with PIL paste
+
+    Args:
+        paths (list[str]): layer file paths in overlay order
+        cache (LayerCache, optional): cache with load_pil_layer loader. Defaults to layer_cache.
+
+    Returns:
+        Image.Image: RGB image
+    """
+    cache = layer_cache if cache is None else cache
+    base_img = Image.new("RGB", (W, H), (0, 0, 0))
+    for path in paths:
+        blend_pil(base_img, cache.get(path))
+    return base_img
+
+
+def composite_numpy(paths: list[str], cache: LayerCache | None = None) -> Image.Image:
+    """
+    stack premultiplied layers in vectorized passes over a reused uint16 buffer,
+    uses the same rounding as PIL paste so the output is pixel identical
+
+    Args:
+        paths (list[str]): layer file paths in overlay order
+        cache (LayerCache, optional): cache with load_array_layer loader. Defaults to layer_cache.
+
+    Returns:
+        Image.Image: RGB image
+    """
+    global _canvas, _carry
+    cache = layer_cache if cache is None else cache
+    if _canvas is None:
+        _canvas = np.empty((H, W, 3), dtype=np.uint16)
+        _carry = np.empty((H, W, 3), dtype=np.uint16)
+    _canvas.fill(0)
+    for path in paths:
+        blend_array(_canvas, _carry, cache.get(path))
+    return Image.fromarray(_canvas.astype(np.uint8), "RGB")
+
+
+def composite(paths: list[str]) -> Image.Image:
+    """
+    stack layers with the compositor selected by COMPOSITOR
+
+    Args:
+        paths (list[str]): layer file paths in overlay order
+
+    Returns:
+        Image.Image: RGB image
+    """
+    if COMPOSITOR == Compositor.numpy.value:
+        return composite_numpy(paths)
+    return composite_pil(paths)
+
+
+class PrefixCompositor:
+    """
+    composite tokens sorted by layer prefix, the frame after each layer of the
+    previous token is kept so layers shared with it are not blended again
+
+    Frames are bounded by max_bytes, layers deeper than the cached frames are
+    blended from the deepest cached one.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = PREFIX_CACHE_MB * 1024 * 1024,
+        compositor: str = COMPOSITOR,
+        cache: LayerCache | None = None,
+    ):
+        """
+        Args:
+            max_bytes (int, optional): memory bound of cached frames. Defaults to PREFIX_CACHE_MB.
+            compositor (str, optional): Compositor value. Defaults to COMPOSITOR.
+            cache (LayerCache, optional): cache with the loader of the compositor. Defaults to layer_cache.
+        """
+        self.numpy = compositor == Compositor.numpy.value
+        self.cache = layer_cache if cache is None else cache
+        self.max_depth = max_bytes // (W * H * (6 if self.numpy else 4))
+        self.paths: list[str] = []
+        self.frames: list = []
+        self.blends = 0
+        self.saved = 0
+        if self.numpy:
+            self.canvas = np.empty((H, W, 3), dtype=np.uint16)
+            self.carry = np.empty((H, W, 3), dtype=np.uint16)
+
+    def composite(self, paths: list[str]) -> Image.Image:
+        """
+        stack layers, starting from the longest cached prefix
+
+        Args:
+            paths (list[str]): layer file paths in overlay order
+
+        Returns:
+            Image.Image: RGB image
+        """
+        common = 0
+        limit = min(len(self.frames), len(paths))
+        while common < limit and paths[common] == self.paths[common]:
+            common += 1
+        del self.frames[common:]
+        self.paths = list(paths)
+        self.saved += common
+        self.blends += len(paths) - common
+
+        if self.numpy:
+            if common:
+                self.canvas[:] = self.frames[-1]
+            else:
+                self.canvas.fill(0)
+            for path in paths[common:]:
+                blend_array(self.canvas, self.carry, self.cache.get(path))
+                if len(self.frames) < min(self.max_depth, len(paths) - 1):
+                    self.frames.append(self.canvas.copy())
+            return Image.fromarray(self.canvas.astype(np.uint8), "RGB")
+
+        base_img = (
+            self.frames[-1].copy() if common else Image.new("RGB", (W, H), (0, 0, 0))
+        )
+        for path in paths[common:]:
+            blend_pil(base_img, self.cache.get(path))
+            if len(self.frames) < min(self.max_depth, len(paths) - 1):
+                self.frames.append(base_img.copy())
+        return base_img
+
+
+def prefix_savings(
+    layer_stacks: list[tuple[str, ...]], max_depth: int
+) -> tuple[int, int]:
+    """
+    count blends of sorted layer stacks with and without the prefix cache
+
+    Args:
+        layer_stacks (list[tuple[str, ...]]): layer paths of each token in render order
+        max_depth (int): frames kept by PrefixCompositor
+
+    Returns:
+        tuple[int, int]: (naive blends, saved blends)
+    """
+    naive = sum(len(stack) for stack in layer_stacks)
+    saved = 0
+    for previous, stack in zip(layer_stacks, layer_stacks[1:]):
+        common = 0
+        limit = min(max_depth, len(previous) - 1, len(stack))
+        while common < limit and stack[common] == previous[common]:
+            common += 1
+        saved += common
+    return naive, saved
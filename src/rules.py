@@ -0,0 +1,325 @@
+import ast
+import numpy as np
+import pandas as pd
+from sampler import CompiledSampler, process_rng
+
+
+def parse_prop_values(text: str) -> list[list[str]]:
+    """
+    parse a list_prop_value cell of rules.csv like "[('First Letter','B'),('Second Letter','A')]"
+
+    Args:
+        text (str): python literal of a (prop, value) tuple or a list of them
+
+    Raises:
+        ValueError: if text is not a (prop, value) tuple or a list of them
+
+    Returns:
+        list[list[str]]: [[prop, value], ...]
+    """
+    try:
+        prop_values = ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        raise ValueError("is invalid")
+    if isinstance(prop_values, tuple) and len(prop_values) == 2:
+        prop_values = [prop_values]
+    if not isinstance(prop_values, (list, tuple)) or not all(
+        isinstance(i, tuple) and len(i) == 2 for i in prop_values
+    ):
+        raise ValueError("should be a list of (prop, value)")
+    return [[str(prop), str(value)] for prop, value in prop_values]
+
+
+class CompiledRules:
+    """
+    rules.csv parsed and validated once into lookups on integer encoded attributes
+
+    Every (prop, value) pair owns a slot, slot = offset of prop + value code.
+    Exclusions (rule -1) become a symmetric conflict matrix between slots,
+    requirements (rule 1) are indexed by the slot of their trigger and applied
+    in rules.csv order, so a value set by one rule can trigger a later one.
+    """
+
+    def __init__(self, df: pd.DataFrame, sampler: CompiledSampler):
+        """
+        Args:
+            df (pd.DataFrame): rule dataframe with prop, value, list_prop_value, rule columns
+            sampler (CompiledSampler): sampler providing the value encoding
+        """
+        self.sampler = sampler
+        sizes = [len(values) for values in sampler.values]
+        self.offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.int32)
+        self.n_slots = int(sum(sizes))
+
+        # available[f, slot] is True if the value has a layer file in folder f
+        self.available = np.zeros((len(sampler.folders), self.n_slots), dtype=bool)
+        for f, folder_codes in enumerate(sampler.codes):
+            for p, codes in enumerate(folder_codes):
+                self.available[f, self.offsets[p] + codes] = True
+
+        self.conflict = np.zeros((self.n_slots, self.n_slots), dtype=bool)
+        # (trigger prop, trigger code, [(target prop, target codes), ...]) in rules.csv order
+        self.requires: list[tuple[int, int, list[tuple[int, np.ndarray]]]] = []
+        self.require_index: dict[int, list[int]] = (
+            {}
+        )  # trigger slot -> requires indexes
+
+        for row_index, row in df.iterrows():
+            rule = int(row["rule"])
+            cell = row["list_prop_value"]  # text, or pairs parsed by the table loader
+            if rule == 0 or (pd.api.types.is_scalar(cell) and pd.isna(cell)):
+                continue
+            if rule not in (1, -1):
+                raise ValueError(f"rule at row {row_index} should be 1, 0 or -1")
+            prop, code = self._lookup(row["prop"], row["value"], row_index)
+            slot = self.offsets[prop] + code
+            targets = self._parse_targets(cell, row_index)
+
+            if rule == -1:
+                for target_prop, target_code in targets:
+                    target_slot = self.offsets[target_prop] + target_code
+                    self.conflict[slot, target_slot] = True
+                    self.conflict[target_slot, slot] = True
+            else:
+                grouped: dict[int, list[int]] = {}
+                for target_prop, target_code in targets:
+                    grouped.setdefault(target_prop, []).append(target_code)
+                self.require_index.setdefault(slot, []).append(len(self.requires))
+                self.requires.append(
+                    (
+                        prop,
+                        code,
+                        [(p, np.array(c, dtype=np.int32)) for p, c in grouped.items()],
+                    )
+                )
+
+        self.has_conflict = bool(self.conflict.any())
+
+    def _lookup(self, prop: str, value: str, row_index) -> tuple[int, int]:
+        if prop not in self.sampler.props:
+            raise ValueError(f'"{prop}" at rules row {row_index} is not a valid prop')
+        p = self.sampler.props.index(prop)
+        value = str(value)
+        if value not in self.sampler.value_index[p]:
+            raise ValueError(
+                f'"{value}" at rules row {row_index} is not a valid value of {prop}'
+            )
+        return p, self.sampler.value_index[p][value]
+
+    def _parse_targets(self, cell, row_index) -> list[tuple[int, int]]:
+        if isinstance(cell, str):
+            try:
+                cell = parse_prop_values(cell)
+            except ValueError as e:
+                raise ValueError(f"list_prop_value at rules row {row_index} {e}")
+        return [self._lookup(prop, value, row_index) for prop, value in cell]
+
+    def slots(self, codes: np.ndarray) -> np.ndarray:
+        """
+        convert value codes to slots
+
+        Args:
+            codes (np.ndarray): value codes with shape (n, props)
+
+        Returns:
+            np.ndarray: slots with shape (n, props)
+        """
+        return codes + self.offsets
+
+    def check(self, codes: np.ndarray) -> np.ndarray:
+        """
+        check candidates have no excluded pair
+
+        Args:
+            codes (np.ndarray): value codes with shape (n, props)
+
+        Returns:
+            np.ndarray: valid mask with shape (n,)
+        """
+        if not self.has_conflict:
+            return np.ones(len(codes), dtype=bool)
+        slots = self.slots(codes)
+        return ~self.conflict[slots[:, :, None], slots[:, None, :]].any(axis=(1, 2))
+
+    def satisfied(self, codes: np.ndarray) -> np.ndarray:
+        """
+        check candidates already meet every rule, requirements are checked instead of applied
+
+        Args:
+            codes (np.ndarray): value codes with shape (n, props)
+
+        Returns:
+            np.ndarray: valid mask with shape (n,)
+        """
+        valid = self.check(codes)
+        for prop, code, targets in self.requires:
+            rows = codes[:, prop] == code
+            for target_prop, target_codes in targets:
+                valid &= ~rows | np.isin(codes[:, target_prop], target_codes)
+        return valid
+
+    def apply(
+        self,
+        folder_idx: np.ndarray,
+        codes: np.ndarray,
+        rng: np.random.Generator | None = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        apply requirements then exclusions to a batch of candidates,
+        a candidate whose required value has no layer file in its folder is invalid too
+
+        Args:
+            folder_idx (np.ndarray): folder indexes with shape (n,)
+            codes (np.ndarray): value codes with shape (n, props)
+            rng (np.random.Generator, optional): used when a requirement lists several values of one prop. Defaults to process_rng().
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: (valid mask, codes after requirements)
+        """
+        source = codes
+        codes = codes.copy()
+        rng = process_rng() if rng is None else rng
+        for prop, code, targets in self.requires:
+            rows = np.flatnonzero(codes[:, prop] == code)
+            if len(rows) == 0:
+                continue
+            for target_prop, target_codes in targets:
+                if len(target_codes) == 1:
+                    codes[rows, target_prop] = target_codes[0]
+                else:
+                    codes[rows, target_prop] = rng.choice(target_codes, len(rows))
+        valid = self.check(codes)
+        if self.requires:
+            forced = codes != source
+            available = self.available[folder_idx[:, None], self.slots(codes)]
+            valid &= (available | ~forced).all(axis=1)
+        return valid, codes
+
+    def draw_constrained(
+        self, n: int, rng: np.random.Generator | None = None
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        draw n candidates prop by prop, values excluded by the values already chosen
+        are removed and the remaining ratios renormalized, then requirements are applied
+
+        Args:
+            n (int): amount of candidates
+            rng (np.random.Generator, optional): random generator. Defaults to process_rng().
+
+        Returns:
+            tuple[np.ndarray, np.ndarray, np.ndarray]: (folder indexes, value codes, valid mask)
+        """
+        sampler = self.sampler
+        rng = process_rng() if rng is None else rng
+        folder_idx = sampler.draw_folders(n, rng)
+        codes = np.empty((n, len(sampler.props)), dtype=np.int32)
+        alive = np.ones(n, dtype=bool)
+        k = rng.random((n, len(sampler.props)))
+        for f in np.unique(folder_idx):
+            rows = np.flatnonzero(folder_idx == f)
+            for p in range(len(sampler.props)):
+                weights = np.broadcast_to(
+                    sampler.weights[f][p], (len(rows), len(sampler.weights[f][p]))
+                )
+                if self.has_conflict and p > 0:
+                    chosen = codes[rows, :p] + self.offsets[:p]
+                    candidates = self.offsets[p] + sampler.codes[f][p]
+                    blocked = self.conflict[
+                        chosen[:, :, None], candidates[None, None, :]
+                    ].any(axis=1)
+                    weights = weights * ~blocked
+                cum = np.cumsum(weights, axis=1)
+                total = cum[:, -1]
+                alive[rows[total <= 0]] = False
+                picked = (cum <= (k[rows, p] * total)[:, None]).sum(axis=1)
+                picked = np.minimum(picked, cum.shape[1] - 1)
+                codes[rows, p] = sampler.codes[f][p][picked]
+        valid, codes = self.apply(folder_idx, codes, rng)
+        return folder_idx, codes, valid & alive
+
+    def rejection_rate(
+        self, n: int = 10000, rng: np.random.Generator | None = None
+    ) -> float:
+        """
+        estimate the share of candidates rejection sampling throws away
+
+        Args:
+            n (int, optional): amount of candidates to try. Defaults to 10000.
+            rng (np.random.Generator, optional): random generator. Defaults to process_rng().
+
+        Returns:
+            float: rejected / drawn
+        """
+        folder_idx, codes = self.sampler.draw(n, rng)
+        valid, _ = self.apply(folder_idx, codes, rng)
+        return 1 - float(valid.mean())
+
+    def find_unsatisfiable(
+        self, max_nodes: int = 100000
+    ) -> list[tuple[str, str | None, str | None]]:
+        """
+        find folders without any rule-valid combination and values with positive ratio
+        which can never be part of a rule-valid combination
+
+        Args:
+            max_nodes (int, optional): search budget per check, a check running out of budget is not reported. Defaults to 100000.
+
+        Returns:
+            list[tuple[str, str | None, str | None]]: (folder, prop, value), prop and value are None when the whole folder is unsatisfiable
+        """
+        sampler = self.sampler
+        if not self.has_conflict and not self.requires:
+            return []
+        rng = np.random.default_rng(0)
+        found = []
+        for f, folder in enumerate(sampler.folders):
+            options = [
+                sampler.codes[f][p][sampler.weights[f][p] > 0]
+                for p in range(len(sampler.props))
+            ]
+            if self._search_valid(f, options, rng, max_nodes) is False:
+                found.append((folder, None, None))
+                continue
+            for p, prop in enumerate(sampler.props):
+                for code in options[p]:
+                    fixed = options.copy()
+                    fixed[p] = np.array([code])
+                    if self._search_valid(f, fixed, rng, max_nodes) is False:
+                        found.append((folder, prop, sampler.values[p][code]))
+        return found
+
+    def _search_valid(
+        self,
+        folder_index: int,
+        options: list[np.ndarray],
+        rng: np.random.Generator,
+        max_nodes: int,
+    ) -> bool | None:
+        # depth first search pruned by exclusions, None when the budget runs out
+        folder = np.array([folder_index])
+        chosen: list[int] = []
+        nodes = 0
+
+        def search(p: int) -> bool | None:
+            nonlocal nodes
+            if p == len(options):
+                valid, _ = self.apply(folder, np.array([chosen]), rng)
+                return bool(valid[0])
+            for code in options[p]:
+                nodes += 1
+                if nodes > max_nodes:
+                    return None
+                slot = self.offsets[p] + code
+                if any(
+                    self.conflict[slot, self.offsets[i] + c]
+                    for i, c in enumerate(chosen)
+                ):
+                    continue
+                chosen.append(int(code))
+                result = search(p + 1)
+                chosen.pop()
+                if result is not False:
+                    return result
+            return False
+
+        return search(0)
@@ -0,0 +1,195 @@
+import os
+import numpy as np
+import pandas as pd
+
+_rng: np.random.Generator | None = None
+_rng_pid: int | None = None
+
+
+def process_rng() -> np.random.Generator:
+    """
+    random generator of current process, forked pool workers get their own fresh entropy
+
+    Returns:
+        np.random.Generator: generator of this process
+    """
+    global _rng, _rng_pid
+    if _rng_pid != os.getpid():
+        _rng = np.random.default_rng()
+        _rng_pid = os.getpid()
+    return _rng  # type: ignore
+
+
+def token_rng(seed: int, token_id: int, *stream: int) -> np.random.Generator:
+    """
+    independent random generator of a token, the same as SeedSequence(seed).spawn()[token_id]
+    so it doesn't depend on which process or machine draws the token
+
+    Args:
+        seed (int): collection seed
+        token_id (int): token index
+        stream (int): extra keys for other uses of the same token
+
+    Returns:
+        np.random.Generator: generator of this token
+    """
+    return np.random.default_rng(
+        np.random.SeedSequence(seed, spawn_key=(token_id, *stream))
+    )
+
+
+class CompiledSampler:
+    """
+    sampling tables compiled once from df_pac
+
+    Every (folder, prop) pair becomes an array of cumulative weights plus an array of
+    value codes, so a whole attribute vector is drawn with np.searchsorted instead of
+    a DataFrame.query per trait. Values are integer encoded per prop, the same code
+    means the same value name whatever folder it comes from.
+    """
+
+    def __init__(
+        self,
+        df_pac: pd.DataFrame,
+        props: list[str],
+        folders: list[str],
+        weights: list[float],
+    ):
+        """
+        Args:
+            df_pac (pd.DataFrame): normalized ratio dataframe indexed by (folder, prop, value)
+            props (list[str]): props in layer order
+            folders (list[str]): parts folders
+            weights (list[float]): occurrence probability of each folder
+        """
+        self.props = list(props)
+        self.folders = list(folders)
+        folder_cum = np.cumsum(np.asarray(weights, dtype=float))
+        self.folder_cum = folder_cum / folder_cum[-1]
+        self.values: list[list[str]] = [[] for _ in self.props]
+        self.value_index: list[dict[str, int]] = [{} for _ in self.props]
+        self.weights: list[list[np.ndarray]] = []
+        self.cum: list[list[np.ndarray]] = []
+        self.codes: list[list[np.ndarray]] = []
+
+        groups = {
+            key: group.droplevel(["folder", "prop"])
+            for key, group in df_pac.groupby(level=["folder", "prop"], sort=False)
+        }
+        for folder in self.folders:
+            folder_weights, folder_cums, folder_codes = [], [], []
+            for prop_index, prop in enumerate(self.props):
+                if (folder, prop) not in groups:
+                    raise ValueError(f"{folder} has no {prop} values in ratio.csv")
+                prop_df = groups[(folder, prop)]
+                ratios = prop_df["ratio"].values.astype(float)
+                cum = np.cumsum(ratios)
+                if cum[-1] <= 0:
+                    raise ValueError(f"all ratios of {folder} {prop} are zero")
+                folder_weights.append(ratios / cum[-1])
+                folder_cums.append(cum / cum[-1])
+                folder_codes.append(
+                    np.array(
+                        [self.encode_value(prop_index, v) for v in prop_df.index],
+                        dtype=np.int32,
+                    )
+                )
+            self.weights.append(folder_weights)
+            self.cum.append(folder_cums)
+            self.codes.append(folder_codes)
+
+    def encode_value(self, prop_index: int, value: str) -> int:
+        """
+        get code of a value, new values are appended to the vocabulary of the prop
+
+        Args:
+            prop_index (int): index of prop in props
+            value (str): value name
+
+        Returns:
+            int: value code
+        """
+        index = self.value_index[prop_index]
+        if value not in index:
+            index[value] = len(self.values[prop_index])
+            self.values[prop_index].append(value)
+        return index[value]
+
+    def draw(
+        self, n: int = 1, rng: np.random.Generator | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        draw n candidates in one vectorized call
+
+        Args:
+            n (int, optional): amount of candidates. Defaults to 1.
+            rng (np.random.Generator, optional): random generator. Defaults to process_rng().
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: (folder indexes with shape (n,), value codes with shape (n, props))
+        """
+        rng = process_rng() if rng is None else rng
+        folder_idx = self.draw_folders(n, rng)
+        codes = np.empty((n, len(self.props)), dtype=np.int32)
+        k = rng.random((n, len(self.props)))
+        for f in np.unique(folder_idx):
+            rows = np.flatnonzero(folder_idx == f)
+            for p in range(len(self.props)):
+                picked = self._search(self.cum[f][p], k[rows, p])
+                codes[rows, p] = self.codes[f][p][picked]
+        return folder_idx, codes
+
+    def draw_folders(self, n: int, rng: np.random.Generator) -> np.ndarray:
+        """
+        draw folder indexes by PARTS_DICT weights
+
+        Args:
+            n (int): amount of candidates
+            rng (np.random.Generator): random generator
+
+        Returns:
+            np.ndarray: folder indexes with shape (n,)
+        """
+        return self._search(self.folder_cum, rng.random(n))
+
+    @staticmethod
+    def _search(cum: np.ndarray, k: np.ndarray) -> np.ndarray:
+        # first index where cum > k, same as scanning np.cumsum(ratio) - k for a positive item
+        return np.minimum(np.searchsorted(cum, k, side="right"), len(cum) - 1)
+
+    def decode(self, folder_index: int, codes) -> list[dict]:
+        """
+        convert an integer encoded vector to random attributes
+
+        Args:
+            folder_index (int): index of folder in folders
+            codes (Sequence[int]): value code of each prop
+
+        Returns:
+            list[dict]: [{"value": (folder, prop, value), "trait_type": prop}]
+        """
+        folder = self.folders[folder_index]
+        return [
+            {"value": (folder, prop, self.values[p][codes[p]]), "trait_type": prop}
+            for p, prop in enumerate(self.props)
+        ]
+
+    def encode(self, attributes: list[dict]) -> tuple[int, np.ndarray]:
+        """
+        convert random attributes to an integer encoded vector
+
+        Args:
+            attributes (list[dict]): [{"value": (folder, prop, value), "trait_type": prop}]
+
+        Returns:
+            tuple[int, np.ndarray]: (folder index, value codes)
+        """
+        folder_index = self.folders.index(attributes[0]["value"][0])
+        codes = np.empty(len(self.props), dtype=np.int32)
+        for attr in attributes:
+            p = self.props.index(attr["trait_type"])
+            value = attr["value"][2]
+            if value not in self.value_index[p]:
+                raise ValueError(f'"{value}" is not a value of {attr["trait_type"]}')
+            codes[p] = self.value_index[p][value]
+        return folder_index, codes
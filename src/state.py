@@ -0,0 +1,322 @@
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing
+from config import STATE, IPFS_INFO_BACKUP
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS parts (
+    path TEXT PRIMARY KEY, folder TEXT, prop TEXT, value TEXT,
+    size INTEGER, mtime INTEGER, error TEXT, sha256 TEXT
+);
+CREATE TABLE IF NOT EXISTS tokens (
+    path TEXT PRIMARY KEY, token INTEGER, name TEXT, folder TEXT,
+    attributes TEXT, rendered INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS tokens_name ON tokens (name);
+CREATE TABLE IF NOT EXISTS uploads (name TEXT PRIMARY KEY, cid TEXT, size TEXT);
+CREATE TABLE IF NOT EXISTS stages (stage TEXT PRIMARY KEY, finished REAL, detail TEXT);
+"""
+# stages in pipeline order, status lists them in this order
+STAGES = ["table", "plan", "render", "merge", "update", "attr", "check"]
+STAGES += ["mystery box", "upload", "metadata", "refresh"]
+
+
+def connect(state_path: str = STATE) -> sqlite3.Connection:
+    """
+    open the project state, tables are created on first use
+
+    Args:
+        state_path (str, optional): sqlite path. Defaults to STATE.
+
+    Returns:
+        sqlite3.Connection: connection, use it as a context manager to commit
+    """
+    conn = sqlite3.connect(state_path, timeout=30)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def record_stage(stage: str, detail: str = "", state_path: str = STATE):
+    """
+    record that a stage finished
+
+    Args:
+        stage (str): one of STAGES
+        detail (str, optional): short note shown by status. Defaults to "".
+        state_path (str, optional): sqlite path. Defaults to STATE.
+    """
+    with closing(connect(state_path)) as conn, conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO stages VALUES (?, ?, ?)",
+            (stage, time.time(), detail),
+        )
+
+
+def record_parts(facts: dict[str, dict], state_path: str = STATE):
+    """
+    replace the part files with the facts of a validation run,
+    hashes of unchanged files are kept
+
+    Args:
+        facts (dict[str, dict]): {path: facts} from validate_layers
+        state_path (str, optional): sqlite path. Defaults to STATE.
+    """
+    with closing(connect(state_path)) as conn, conn:
+        hashes = {
+            (path, size, mtime): sha256
+            for path, size, mtime, sha256 in conn.execute(
+                "SELECT path, size, mtime, sha256 FROM parts"
+            )
+        }
+        conn.execute("DELETE FROM parts")
+        rows = []
+        for path, f in facts.items():
+            folder, subfolder = path.split(os.sep)[:2]
+            rows.append(
+                (
+                    path,
+                    folder,
+                    subfolder.split("_")[1],
+                    os.path.splitext(os.path.basename(path))[0],
+                    f["size"],
+                    f["mtime"],
+                    f["error"],
+                    hashes.get((path, f["size"], f["mtime"])),
+                )
+            )
+        conn.executemany("INSERT INTO parts VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+
+def read_parts(folders: list[str], state_path: str = STATE) -> list[str] | None:
+    """
+    part files indexed by the last table stage, instead of walking the folders
+
+    Args:
+        folders (list[str]): parts folders
+        state_path (str, optional): sqlite path. Defaults to STATE.
+
+    Returns:
+        list[str] | None: sorted part file paths, None if a folder has no indexed part
+    """
+    if not os.path.exists(state_path):
+        # reading alone doesn't create the state, e.g. in a fresh checkout
+        return None
+    with closing(connect(state_path)) as conn:
+        rows = conn.execute("SELECT folder, path FROM parts ORDER BY path").fetchall()
+    if set(folders) - set(folder for folder, _ in rows):
+        return None
+    return [path for folder, path in rows if folder in folders]
+
+
+def record_hashes(hashes: dict[str, str], state_path: str = STATE):
+    """
+    save content hashes of part files
+
+    Args:
+        hashes (dict[str, str]): {path: sha256 hex digest} from hash_files
+        state_path (str, optional): sqlite path. Defaults to STATE.
+    """
+    with closing(connect(state_path)) as conn, conn:
+        conn.executemany(
+            "UPDATE parts SET sha256 = ? WHERE path = ?",
+            [(digest, path) for path, digest in hashes.items()],
+        )
+
+
+def record_tokens(
+    rows: list[tuple[str, str | None, list[str]]],
+    rendered: bool,
+    state_path: str = STATE,
+):
+    """
+    replace the tokens with a new plan or the images on disk
+
+    Args:
+        rows (list[tuple[str, str | None, list[str]]]): (image path, parts folder or None, values) of every token
+        rendered (bool): the images exist already
+        state_path (str, optional): sqlite path. Defaults to STATE.
+    """
+    with closing(connect(state_path)) as conn, conn:
+        conn.execute("DELETE FROM tokens")
+        conn.executemany(
+            "INSERT INTO tokens VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    path,
+                    int(os.path.basename(path).split("-")[0]),
+                    os.path.basename(path),
+                    folder,
+                    "-".join(values),
+                    int(rendered),
+                )
+                for path, folder, values in rows
+            ],
+        )
+
+
+def mark_rendered(paths: list[str], state_path: str = STATE):
+    """
+    mark planned images as rendered
+
+    Args:
+        paths (list[str]): image paths as planned
+        state_path (str, optional): sqlite path. Defaults to STATE.
+    """
+    with closing(connect(state_path)) as conn, conn:
+        conn.executemany(
+            "UPDATE tokens SET rendered = 1 WHERE path = ?", [(p,) for p in paths]
+        )
+
+
+def drop_tokens(paths: list[str], state_path: str = STATE):
+    """
+    remove tokens whose images were deleted
+
+    Args:
+        paths (list[str]): image paths
+        state_path (str, optional): sqlite path. Defaults to STATE.
+    """
+    with closing(connect(state_path)) as conn, conn:
+        conn.executemany("DELETE FROM tokens WHERE path = ?", [(p,) for p in paths])
+
+
+def record_uploads(infos: list[dict], state_path: str = STATE):
+    """
+    save CIDs of uploaded files
+
+    Args:
+        infos (list[dict]): ipfs info like {"Name": str, "Hash": str, "Size": str}
+        state_path (str, optional): sqlite path. Defaults to STATE.
+    """
+    with closing(connect(state_path)) as conn, conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO uploads VALUES (?, ?, ?)",
+            [(i["Name"], i["Hash"], i["Size"]) for i in infos if i is not None],
+        )
+
+
+def forget_uploads(
+    names: list[str], state_path: str = STATE, backup_path: str = IPFS_INFO_BACKUP
+):
+    """
+    drop CIDs of files whose content changed, they need uploading again.
+    They are dropped from the upload backup too, reading it must not restore them
+
+    Args:
+        names (list[str]): file names
+        state_path (str, optional): sqlite path. Defaults to STATE.
+        backup_path (str, optional): ipfs info backup of upload.py. Defaults to IPFS_INFO_BACKUP.
+    """
+    with closing(connect(state_path)) as conn, conn:
+        conn.executemany("DELETE FROM uploads WHERE name = ?", [(n,) for n in names])
+    if not names or not os.path.exists(backup_path):
+        return
+    forgotten = set(names)
+    with open(backup_path) as f:
+        backup = json.load(f)
+    kept = [info for info in backup if info is None or info["Name"] not in forgotten]
+    if len(kept) != len(backup):
+        with open(backup_path + ".tmp", "w") as f:
+            f.write(json.dumps(kept))
+        os.replace(backup_path + ".tmp", backup_path)
+
+
+def read_uploads(state_path: str = STATE) -> list[dict]:
+    """
+    CIDs of uploaded files, one per name
+
+    Args:
+        state_path (str, optional): sqlite path. Defaults to STATE.
+
+    Returns:
+        list[dict]: ipfs info like {"Name": str, "Hash": str, "Size": str}
+    """
+    with closing(connect(state_path)) as conn:
+        return [
+            {"Name": name, "Hash": cid, "Size": size}
+            for name, cid, size in conn.execute("SELECT * FROM uploads ORDER BY name")
+        ]
+
+
+def pending_uploads(state_path: str = STATE) -> list[str] | None:
+    """
+    rendered images without a CID, in token order
+
+    Args:
+        state_path (str, optional): sqlite path. Defaults to STATE.
+
+    Returns:
+        list[str] | None: names of files which exist, None if the state has no rendered token
+    """
+    with closing(connect(state_path)) as conn:
+        if not conn.execute("SELECT 1 FROM tokens WHERE rendered").fetchone():
+            return None
+        return [
+            name
+            for path, name in conn.execute(
+                "SELECT path, name FROM tokens WHERE rendered AND name NOT IN "
+                "(SELECT name FROM uploads) ORDER BY token"
+            )
+            if os.path.exists(path)
+        ]
+
+
+def read_status(state_path: str = STATE) -> dict:
+    """
+    progress of the project from the state alone, nothing is scanned
+
+    Args:
+        state_path (str, optional): sqlite path. Defaults to STATE.
+
+    Returns:
+        dict: counts of parts, broken parts, hashed parts, planned, rendered and uploaded tokens,
+            and stages {stage: (finished, detail)}
+    """
+    with closing(connect(state_path)) as conn:
+        status = dict(
+            zip(
+                ["parts", "broken", "hashed"],
+                conn.execute(
+                    "SELECT COUNT(*), COUNT(error), COUNT(sha256) FROM parts"
+                ).fetchone(),
+            )
+        )
+        status |= dict(
+            zip(
+                ["planned", "rendered", "uploaded"],
+                conn.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(rendered), 0), "
+                    "COUNT(uploads.name) FROM tokens "
+                    "LEFT JOIN uploads ON tokens.name = uploads.name"
+                ).fetchone(),
+            )
+        )
+        status["stages"] = {
+            stage: (finished, detail)
+            for stage, finished, detail in conn.execute("SELECT * FROM stages")
+        }
+    return status
+
+
+def print_status(status: dict):
+    """
+    print read_status results
+
+    Args:
+        status (dict): result of read_status
+    """
+    print(
+        f"parts: {status['parts']} files, {status['broken']} with errors, {status['hashed']} hashed"
+    )
+    print(
+        f"tokens: {status['planned']} planned, {status['rendered']} rendered, {status['uploaded']} uploaded"
+    )
+    for stage in STAGES:
+        if stage in status["stages"]:
+            finished, detail = status["stages"][stage]
+            when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(finished))
+            print(f"{stage:<12} finished {when}  {detail}")
+        else:
+            print(f"{stage:<12} -")
@@ -0,0 +1,209 @@
+import os
+from typing import Callable
+import pandas as pd
+from config import ARROW_TABLES
+
+
+def load_pyarrow(arrow_folder: str | None = ARROW_TABLES):
+    """
+    pyarrow if Arrow copies are enabled and it is installed
+
+    Args:
+        arrow_folder (str, optional): folder of Arrow copies, None disables them. Defaults to ARROW_TABLES.
+
+    Returns:
+        module | None: pyarrow with pyarrow.ipc loaded, None to read csv only
+    """
+    if arrow_folder is None:
+        return None
+    try:
+        import pyarrow
+        import pyarrow.ipc
+    except ImportError:
+        return None
+    return pyarrow
+
+
+def arrow_path(csv_path: str, arrow_folder: str) -> str | None:
+    """
+    path of the Arrow copy of a csv, its path in the project is flattened into the name.
+    The project is the folder holding arrow_folder, csv files outside it like temporary ones get no copy
+
+    Args:
+        csv_path (str): csv path
+        arrow_folder (str): folder of Arrow copies
+
+    Returns:
+        str | None: path ending with .arrow, None if the csv is not in the project
+    """
+    project = os.path.dirname(os.path.abspath(arrow_folder))
+    relative = os.path.relpath(os.path.abspath(csv_path), project)
+    if relative.split(os.sep)[0] == os.pardir:
+        return None
+    name = os.path.splitext(relative)[0].replace(os.sep, "__")
+    return os.path.join(arrow_folder, name + ".arrow")
+
+
+def csv_stamp(csv_path: str) -> bytes:
+    """
+    size and mtime of a csv, an Arrow copy is valid while they match
+
+    Args:
+        csv_path (str): csv path
+
+    Returns:
+        bytes: stamp saved in the Arrow schema metadata
+    """
+    stat = os.stat(csv_path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}".encode()
+
+
+def read_options(
+    categories: list[str], parsers: dict[str, Callable], csv_options: dict
+) -> bytes:
+    """
+    how a csv was read, an Arrow copy is only used by a reader passing the same options
+
+    Args:
+        categories (list[str]): columns read as categoricals
+        parsers (dict[str, Callable]): {column: function} parsing text cells
+        csv_options (dict): pd.read_csv keyword arguments
+
+    Returns:
+        bytes: options saved in the Arrow schema metadata
+    """
+    return repr(
+        (
+            sorted(categories),
+            sorted((column, parse.__qualname__) for column, parse in parsers.items()),
+            sorted((key, repr(value)) for key, value in csv_options.items()),
+        )
+    ).encode()
+
+
+def write_arrow(
+    df: pd.DataFrame,
+    csv_path: str,
+    options: bytes,
+    arrow_folder: str | None = ARROW_TABLES,
+):
+    """
+    save the Arrow copy of a csv which was just read or written, nothing is saved
+    without pyarrow
+
+    Args:
+        df (pd.DataFrame): content of the csv, categorical columns are dictionary encoded
+        csv_path (str): csv path
+        options (bytes): read options of the content, from read_options
+        arrow_folder (str, optional): folder of Arrow copies, None saves nothing. Defaults to ARROW_TABLES.
+            Nothing is saved for a csv outside the project either, see arrow_path
+
+    Raises:
+        ValueError: if a column can't be converted to an Arrow type
+    """
+    pa = load_pyarrow(arrow_folder)
+    if pa is None:
+        return
+    path = arrow_path(csv_path, arrow_folder)
+    if path is None:
+        return
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata(
+        (table.schema.metadata or {})
+        | {b"source": csv_stamp(csv_path), b"options": options}
+    )
+    os.makedirs(arrow_folder, exist_ok=True)
+    with pa.OSFile(path + ".part", "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(path + ".part", path)
+
+
+def read_table(
+    csv_path: str,
+    categories: list[str] = [],
+    parsers: dict[str, Callable] = {},
+    arrow_folder: str | None = ARROW_TABLES,
+    **csv_options,
+) -> pd.DataFrame:
+    """
+    read a csv table through its Arrow copy. Designers keep editing the csv,
+    the copy is memory mapped while the csv is unchanged and rebuilt when it changes
+    or was saved with other options
+
+    Args:
+        csv_path (str): csv path
+        categories (list[str], optional): columns read as categoricals, missing ones are skipped. Defaults to [].
+        parsers (dict[str, Callable], optional): {column: function} parsing text cells once for the copy,
+            like the list literals of rules.csv, the copy is not written if one raises ValueError. Defaults to {}.
+        arrow_folder (str, optional): folder of Arrow copies, None reads the csv only. Defaults to ARROW_TABLES.
+            A csv outside the project is read without a copy, see arrow_path
+        **csv_options: pd.read_csv keyword arguments
+
+    Returns:
+        pd.DataFrame: table, parsed columns stay text when read from csv only
+    """
+    pa = load_pyarrow(arrow_folder)
+    if pa is not None and arrow_path(csv_path, arrow_folder) is None:
+        pa = None
+    options = read_options(categories, parsers, csv_options)
+    if pa is not None:
+        try:
+            table = pa.ipc.open_file(
+                pa.memory_map(arrow_path(csv_path, arrow_folder))
+            ).read_all()
+            metadata = table.schema.metadata or {}
+            if metadata.get(b"source") == csv_stamp(csv_path) and (
+                metadata.get(b"options") == options
+            ):
+                return table.to_pandas()
+        except (OSError, pa.ArrowInvalid):
+            pass
+    df = pd.read_csv(csv_path, **csv_options)
+    for column in categories:
+        if column in df.columns:
+            df[column] = df[column].astype("category")
+    if pa is None:
+        return df
+    parsed = df.copy()
+    try:
+        for column, parse in parsers.items():
+            parsed[column] = [
+                parse(cell) if isinstance(cell, str) else None for cell in df[column]
+            ]
+        write_arrow(parsed, csv_path, options, arrow_folder)
+    except (ValueError, TypeError):
+        # a bad cell or mixed types, keep the text so the table owner reports it
+        return df
+    return parsed
+
+
+def write_table(
+    df: pd.DataFrame,
+    csv_path: str,
+    categories: list[str] = [],
+    arrow_folder: str | None = ARROW_TABLES,
+    **csv_options,
+):
+    """
+    write a table as csv for designers, with its Arrow copy
+
+    Args:
+        df (pd.DataFrame): table
+        csv_path (str): csv path
+        categories (list[str], optional): columns stored dictionary encoded. Defaults to [].
+        arrow_folder (str, optional): folder of Arrow copies, None writes the csv only. Defaults to ARROW_TABLES.
+        **csv_options: pd.read_csv keyword arguments of the reader, the copy is used by
+            read_table with the same categories and options
+    """
+    df.to_csv(csv_path, index=False)
+    try:
+        write_arrow(
+            df.astype({column: "category" for column in categories}),
+            csv_path,
+            read_options(categories, {}, csv_options),
+            arrow_folder,
+        )
+    except (ValueError, TypeError):
+        # mixed types, the copy is built from the csv when it is read
+        pass
@@ -1,14 +1,7 @@
 import asyncio
 import os
-from typing import Optional, TypedDict, cast
-from httpx import (
-    AsyncClient,
-    Limits,
-    Client,
-    Response,
-)
+from typing import TYPE_CHECKING, Optional, TypedDict, cast
 import json
-import pandas as pd
 import random
 from config import (
     IMAGES,
@@ -21,9 +14,19 @@ from config import (
     UPLOAD_METADATA,
     PIN_FILES,
     IPFS_INFO_BACKUP,
+    IMAGE_CONTENT_TYPE,
+    OUTPUT_CONTENT_TYPES,
+    OUTPUT_EXTENSIONS,
+    SEED,
+    SHUFFLE,
+    START_ID,
 )
+from writer import list_images
+from state import record_stage, record_uploads, read_uploads, pending_uploads
 
-from final_check import RENAME_DF, START_ID
+if TYPE_CHECKING:
+    import pandas as pd
+    from httpx import AsyncClient
 
 
 IPFSInfo = TypedDict("IPFSInfo", {"Name": str, "Hash": str, "Size": str})
@@ -33,6 +36,22 @@ class MaxRetryReachException(Exception):
     pass
 
 
+def content_extension(content_type: str) -> str:
+    """
+    file extension of a content type, image/jpeg files are saved as .jpg
+
+    Args:
+        content_type (str): mime file type
+
+    Returns:
+        str: extension without dot
+    """
+    for output_format, output_content_type in OUTPUT_CONTENT_TYPES.items():
+        if output_content_type == content_type:
+            return OUTPUT_EXTENSIONS[output_format]
+    return content_type.split("/")[-1]
+
+
 async def upload_task(
     files_path_chunk: list[str], wait_seconds: float
 ) -> Optional[list[dict]]:
@@ -46,6 +65,8 @@ async def upload_task(
     Returns:
         Optional[list[dict]]: 10 files ipfs info
     """
+    from httpx import AsyncClient, Limits
+
     await asyncio.sleep(wait_seconds)
 
     async with AsyncClient(
@@ -62,7 +83,7 @@ async def upload_task(
         return result
 
 
-async def upload_single_async(client: AsyncClient, file_path: str) -> Optional[dict]:
+async def upload_single_async(client: "AsyncClient", file_path: str) -> Optional[dict]:
     """
     upload folder to ipfs
 
@@ -79,7 +100,7 @@ async def upload_single_async(client: AsyncClient, file_path: str) -> Optional[d
         try:
             if retry == max_retries:
                 raise MaxRetryReachException()
-            response: Response = await client.post(
+            response = await client.post(
                 f"https://ipfs.infura.io:5001/api/v0/add",
                 params={
                     "pin": "true" if PIN_FILES else "false"
@@ -106,20 +127,22 @@ async def upload_single_async(client: AsyncClient, file_path: str) -> Optional[d
 
 
 def upload_folder(
-    folder_name: str, content_type: str = "image/png"
+    folder_name: str, content_type: str = IMAGE_CONTENT_TYPE
 ) -> tuple[Optional[str], Optional[list[dict]]]:
     """
     upload folder to ipfs
 
     Args:
         folder_name (str): folder name to upload
-        content_type (str, optional): mime file type. Defaults to "image/png".
+        content_type (str, optional): mime file type. Defaults to IMAGE_CONTENT_TYPE.
 
     Returns:
         tuple[Optional[str], Optional[list[dict]]]: (folder_hash, images_dict_list)
     """
+    from httpx import Client
+
     files = []
-    extension = content_type.split("/")[-1]
+    extension = content_extension(content_type)
 
     files = [
         (file, open(os.path.join(folder_name, file), "rb"))
@@ -168,6 +191,7 @@ def dump_ipfs_info_list_to_local(results: list[IPFSInfo]) -> list[IPFSInfo]:
     Returns:
         list[IPFSInfo]: ipfs info list to save
     """
+    record_uploads(results)  # type: ignore
     if os.path.exists(IPFS_INFO_BACKUP):
         with open(IPFS_INFO_BACKUP, "r") as f:
             backup_data: list[IPFSInfo] = json.loads(f.read())  # type: ignore
@@ -231,11 +255,12 @@ def upload_files(file_paths: list[str]) -> list[IPFSInfo]:
         dump_ipfs_info_list_to_local(results)
         exit()
     print(f"upload new {len(results)} files complete.")
+    record_stage("upload", f"{len(results)} files")
     return results
 
 
 def generate_metadata(
-    df: pd.DataFrame,
+    df: "pd.DataFrame",
     image_ipfs_data: list[IPFSInfo],
     start_id: int = 0,
     image_folder: str = IMAGES,
@@ -276,9 +301,15 @@ def generate_metadata(
             if row[col] != "empty"
         ]
         hash = image_dict["Hash"]
+        if SEED is None:
+            name = random.choice(NAMES)
+        else:
+            from sampler import token_rng
+
+            name = NAMES[token_rng(SEED, index, 1).integers(len(NAMES))]
 
         info_dict = {
-            "name": f"{random.choice(NAMES)} #{index}",
+            "name": f"{name} #{index}",
             "description": f"{DESCRIPTION}",
             "image": f"ipfs://{hash}/",
             "attributes": attributes,
@@ -300,23 +331,24 @@ def read_images_from_local() -> list[IPFSInfo]:
     with open(IPFS_INFO_BACKUP, "r") as f:
         result: list[IPFSInfo] = json.load(f)
         print(f"read {len(result)} ipfs data from local")
+        record_uploads(result)  # type: ignore
         return result
 
 
 def upload_all_in_image_folder(
-    folder_name: str = IMAGES, content_type: str = "image/png"
+    folder_name: str = IMAGES, content_type: str = IMAGE_CONTENT_TYPE
 ) -> list[IPFSInfo]:
     """
     upload all files in the folder
 
     Args:
         folder_name (str, optional): folder name. Defaults to IMAGES.
-        content_type (str, optional): content_type header, support png, jpeg, json. Defaults to "image/png".
+        content_type (str, optional): content_type header, support png, jpeg, webp, json. Defaults to IMAGE_CONTENT_TYPE.
 
     Returns:
         list[IPFSInfo]: file upload ipfs info
     """
-    extension = content_type.split("/")[-1]
+    extension = content_extension(content_type)
     file_paths = [
         os.path.join(folder_name, file_path)
         for file_path in list(
@@ -330,6 +362,10 @@ def upload_all_in_image_folder(
 
 
 if __name__ == "__main__":
+    from final_check import generate_csv
+
+    # rename before uploading, metadata matches images by the uploaded names
+    df = generate_csv(SHUFFLE)
     if not PIN_FILES:
         print(
             f"Pin file is {PIN_FILES}, set PIN_FILES=True in config.py if want to pin files"
@@ -341,20 +377,19 @@ if __name__ == "__main__":
             if image_ipfs_data == None:
                 upload_all_in_image_folder()
             else:
-                # get file names in IMAGES folder
-                image_names: list[str] = [
-                    file_name
-                    for file_name in os.listdir(IMAGES)
-                    if file_name != "attr.csv"
-                ]
-                # filter image_names not in image_ipfs_data's Name
-                images_not_upload: list[str] = list(
-                    filter(
-                        lambda i: i
-                        not in [ipfs_info["Name"] for ipfs_info in image_ipfs_data],  # type: ignore
-                        image_names,
+                # rendered images without a CID in the project state
+                images_not_upload = pending_uploads()
+                if images_not_upload is None:
+                    # no state yet, get file names in IMAGES folder
+                    image_names: list[str] = list_images(IMAGES)
+                    # filter image_names not in image_ipfs_data's Name
+                    images_not_upload = list(
+                        filter(
+                            lambda i: i
+                            not in [ipfs_info["Name"] for ipfs_info in image_ipfs_data],  # type: ignore
+                            image_names,
+                        )
                     )
-                )
                 if len(images_not_upload) != 0:
                     confirm_upload: str = input(
                         f"found {len(images_not_upload)} files are not uploaded, press 'y' to upload (y/n)"
@@ -373,14 +408,16 @@ if __name__ == "__main__":
     else:
         image_ipfs_data: list[IPFSInfo] = upload_all_in_image_folder()
 
-    df = RENAME_DF
-    start, end = generate_metadata(df, image_ipfs_data, START_ID)
+    # every upload is recorded in the state, without CIDs dropped since by update
+    start, end = generate_metadata(df, read_uploads(), START_ID)
     print(f"Generate metadata complete, Index from {start} to {end}")
+    record_stage("metadata", f"tokens {start} to {end}")
 
     if UPLOAD_METADATA:
         print("uploading metadata")
         metadata_root, _ = upload_folder(METADATA, "application/json")
         print(f"upload metadatas complete")
+        record_stage("metadata", f"tokens {start} to {end}, root {metadata_root}")
         print(
             f"Source url is {metadata_root}, you can visit ipfs://{metadata_root}/{start}.json to check"
         )
@@ -11,6 +11,7 @@ import random
 import json
 import os
 from upload import upload_folder
+from state import record_stage
 
 
 def generate_mystery_box_metadata():
@@ -36,3 +37,4 @@ if __name__ == "__main__":
     if UPLOAD_MYSTERY_BOX_METADATA:
         metadata_root, _ = upload_folder(MYSTERY_BOX_DATA_FOLDER, "application/json")
         print(f"upload mystery box data complete, hash is {metadata_root}")
+    record_stage("mystery box", f"{AMOUNT} tokens")
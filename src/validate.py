@@ -0,0 +1,151 @@
+import json
+import os
+from multiprocessing import Pool, cpu_count
+from PIL import Image
+from config import EXTENSION, W, H, LAYER_FACTS, USE_MULTIPROCESS, WORKERS
+
+# modes which convert to RGBA without loss
+LAYER_MODES = ["RGBA", "RGB", "P", "LA", "L"]
+_facts: dict[str, dict] | None = None
+
+
+def inspect_layer(path: str) -> dict:
+    """
+    decode a part file fully and collect what validation and rendering need
+
+    Args:
+        path (str): part file path
+
+    Returns:
+        dict: size and mtime of the file, error (None if the layer is usable), mode,
+            transparent (any pixel not opaque), opaque (every pixel opaque) and
+            bbox [left, top, right, bottom] of visible pixels (None if fully transparent)
+    """
+    stat = os.stat(path)
+    facts = {
+        "size": stat.st_size,
+        "mtime": stat.st_mtime_ns,
+        "error": None,
+        "mode": None,
+        "transparent": None,
+        "opaque": None,
+        "bbox": None,
+    }
+    if path.split(".")[-1] not in EXTENSION:
+        facts["error"] = f"{path}'s extension is not {EXTENSION}"
+        return facts
+    try:
+        with Image.open(path) as img:
+            img.load()
+            facts["mode"] = img.mode
+            if img.mode not in LAYER_MODES:
+                facts["error"] = f"{path} mode {img.mode} is not one of {LAYER_MODES}"
+                return facts
+            if img.width != W:
+                facts["error"] = f"{path} width not equal {W}"
+                return facts
+            if img.height != H:
+                facts["error"] = f"{path} height not equal {H}"
+                return facts
+            alpha = img.convert("RGBA").getchannel("A")
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as e:
+        facts["error"] = f"{path} is corrupted: {e}"
+        return facts
+    low, _ = alpha.getextrema()
+    bbox = alpha.getbbox()
+    facts["transparent"] = low < 255
+    facts["opaque"] = low == 255
+    facts["bbox"] = list(bbox) if bbox else None
+    return facts
+
+
+def is_fresh(path: str, facts: dict | None) -> bool:
+    """
+    check cached facts still describe a file
+
+    Args:
+        path (str): part file path
+        facts (dict, optional): cached facts from inspect_layer
+
+    Returns:
+        bool: True if the file has the size and mtime the facts were taken from
+    """
+    if facts is None:
+        return False
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return False
+    return facts["size"] == stat.st_size and facts["mtime"] == stat.st_mtime_ns
+
+
+def read_layer_facts(facts_path: str = LAYER_FACTS) -> dict[str, dict]:
+    """
+    read the facts sidecar, a missing or damaged sidecar is empty
+
+    Args:
+        facts_path (str, optional): json path. Defaults to LAYER_FACTS.
+
+    Returns:
+        dict[str, dict]: {path: facts}
+    """
+    try:
+        with open(facts_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def validate_layers(
+    files_path: list[str], facts_path: str = LAYER_FACTS, workers: int = WORKERS
+) -> dict[str, dict]:
+    """
+    inspect part files in a process pool, files whose size and mtime match the
+    sidecar are not opened again
+
+    Args:
+        files_path (list[str]): part file paths
+        facts_path (str, optional): json sidecar of facts. Defaults to LAYER_FACTS.
+        workers (int, optional): processes, 0 uses cpu_count() - 1. Defaults to WORKERS.
+
+    Returns:
+        dict[str, dict]: {path: facts} of files_path
+    """
+    cached = read_layer_facts(facts_path)
+    stale = [path for path in files_path if not is_fresh(path, cached.get(path))]
+    if workers <= 0:
+        workers = max(cpu_count() - 1, 1)
+    if USE_MULTIPROCESS and workers > 1 and len(stale) > 1:
+        with Pool(min(workers, len(stale))) as pool:
+            checked = pool.map(
+                inspect_layer, stale, chunksize=max(len(stale) // (workers * 4), 1)
+            )
+    else:
+        checked = [inspect_layer(path) for path in stale]
+    facts = {path: cached[path] for path in files_path if path not in stale}
+    facts.update(zip(stale, checked))
+    tmp_path = facts_path + ".part"
+    with open(tmp_path, "w") as f:
+        json.dump(facts, f, indent=0)
+    os.replace(tmp_path, facts_path)
+    print(f"validated {len(files_path)} layers, {len(stale)} checked again")
+    return facts
+
+
+def layer_facts(path: str) -> dict | None:
+    """
+    facts of a part file from the sidecar written by get_table.py, read once per process
+
+    Args:
+        path (str): part file path
+
+    Returns:
+        dict | None: facts from inspect_layer, None if missing, stale or the layer has an error
+    """
+    global _facts
+    if _facts is None:
+        _facts = read_layer_facts()
+    facts = _facts.get(path)
+    if facts is None or facts["error"] or not is_fresh(path, facts):
+        return None
+    return facts
@@ -0,0 +1,213 @@
+import io
+import os
+import queue
+import threading
+import time
+from typing import TYPE_CHECKING
+from config import (
+    ENCODER_THREADS,
+    WRITE_QUEUE_SIZE,
+    WRITE_BUFFER_KB,
+    QUALITY,
+    OUTPUT_FORMAT,
+    OutputFormat,
+    PNG_COMPRESS_LEVEL,
+    WEBP_QUALITY,
+    IMAGE_EXTENSION,
+)
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+
+def save_options(output_format: str = OUTPUT_FORMAT) -> dict:
+    """
+    Image.save keyword arguments of an output format
+
+    Args:
+        output_format (str, optional): OutputFormat value. Defaults to OUTPUT_FORMAT.
+
+    Returns:
+        dict: keyword arguments for Image.save
+    """
+    if output_format == OutputFormat.png.value:
+        return {"format": "png", "compress_level": PNG_COMPRESS_LEVEL}
+    if output_format == OutputFormat.webp_lossless.value:
+        return {"format": "webp", "lossless": True, "quality": WEBP_QUALITY}
+    if output_format == OutputFormat.webp.value:
+        return {"format": "webp", "quality": WEBP_QUALITY}
+    return {"format": "jpeg", "quality": QUALITY}
+
+
+def encode_image(img: "Image.Image", output_format: str = OUTPUT_FORMAT) -> bytes:
+    """
+    encode an image in memory
+
+    Args:
+        img (Image.Image): RGB image
+        output_format (str, optional): OutputFormat value. Defaults to OUTPUT_FORMAT.
+
+    Returns:
+        bytes: encoded file content
+    """
+    buffer = io.BytesIO()
+    img.save(buffer, **save_options(output_format))
+    return buffer.getvalue()
+
+
+def list_images(folder: str, extension: str = IMAGE_EXTENSION) -> list[str]:
+    """
+    generated image file names in a folder
+
+    Args:
+        folder (str): images folder
+        extension (str, optional): image extension. Defaults to IMAGE_EXTENSION.
+
+    Returns:
+        list[str]: file names with the extension
+    """
+    return [f for f in os.listdir(folder) if os.path.splitext(f)[1] == f".{extension}"]
+
+
+class ImageWriter:
+    """
+    encode and write finished frames in background threads
+
+    Frames wait in a bounded queue, encoder threads turn them into bytes (Pillow
+    releases the GIL while encoding) and write them with a large buffer, so
+    compositing only waits when the queue is full.
+    """
+
+    def __init__(
+        self,
+        threads: int = ENCODER_THREADS,
+        queue_size: int = WRITE_QUEUE_SIZE,
+        buffer_size: int = WRITE_BUFFER_KB * 1024,
+        output_format: str = OUTPUT_FORMAT,
+    ):
+        """
+        Args:
+            threads (int, optional): encoder threads, 0 encodes inline. Defaults to ENCODER_THREADS.
+            queue_size (int, optional): max frames waiting for an encoder. Defaults to WRITE_QUEUE_SIZE.
+            buffer_size (int, optional): file write buffer in bytes. Defaults to WRITE_BUFFER_KB.
+            output_format (str, optional): OutputFormat value. Defaults to OUTPUT_FORMAT.
+        """
+        self.buffer_size = buffer_size
+        self.output_format = output_format
+        self.queue: queue.Queue = queue.Queue(maxsize=max(queue_size, 1))
+        self.lock = threading.Lock()
+        self.errors: list[Exception] = []
+        self.stats = {
+            "frames": 0,
+            "written_bytes": 0,
+            "encode_seconds": 0.0,
+            "write_seconds": 0.0,
+            "wait_seconds": 0.0,
+            "max_queue_depth": 0,
+            "queue_depth_sum": 0,
+        }
+        self.threads = [
+            threading.Thread(target=self._run, daemon=True) for _ in range(threads)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, img: "Image.Image", path: str):
+        """
+        queue a frame, blocks while the queue is full
+
+        Args:
+            img (Image.Image): finished RGB frame, must not be modified afterwards
+            path (str): file path to save
+        """
+        if not self.threads:
+            self._save(img, path)
+            return
+        depth = self.queue.qsize()
+        start = time.perf_counter()
+        self.queue.put((img, path))
+        with self.lock:
+            self.stats["wait_seconds"] += time.perf_counter() - start
+            self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], depth)
+            self.stats["queue_depth_sum"] += depth
+
+    def flush(self):
+        """
+        wait until every queued frame is on disk
+
+        Raises:
+            Exception: first error raised by an encoder thread
+        """
+        if self.threads:
+            self.queue.join()
+        if self.errors:
+            raise self.errors[0]
+
+    def close(self) -> dict:
+        """
+        flush and stop encoder threads
+
+        Returns:
+            dict: counters from get_stats
+        """
+        self.flush()
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        return self.get_stats()
+
+    def get_stats(self) -> dict:
+        """
+        writer counters
+
+        Returns:
+            dict: frames, written bytes, encode/write/wait seconds, max and summed queue depth
+        """
+        with self.lock:
+            return dict(self.stats)
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                self._save(*item)
+            except Exception as e:
+                self.errors.append(e)
+            finally:
+                self.queue.task_done()
+
+    def _save(self, img: "Image.Image", path: str):
+        start = time.perf_counter()
+        content = encode_image(img, self.output_format)
+        encoded = time.perf_counter()
+        # write aside then rename, a crash never leaves a partial image under its real name
+        part_path = path + ".part"
+        with open(part_path, "wb", buffering=self.buffer_size) as f:
+            f.write(content)
+        os.replace(part_path, path)
+        written = time.perf_counter()
+        with self.lock:
+            self.stats["frames"] += 1
+            self.stats["written_bytes"] += len(content)
+            self.stats["encode_seconds"] += encoded - start
+            self.stats["write_seconds"] += written - encoded
+
+
+def print_writer_stats(stats: dict):
+    """
+    print writer counters
+
+    Args:
+        stats (dict): counters from ImageWriter.get_stats, summed over workers
+    """
+    frames = max(stats["frames"], 1)
+    print(
+        f"writer: {stats['frames']} frames, {stats['written_bytes'] / 1024 / 1024:.1f}MB, "
+        f"encode {stats['encode_seconds']:.2f}s, write {stats['write_seconds']:.2f}s, "
+        f"compositing waited {stats['wait_seconds']:.2f}s, "
+        f"queue depth avg {stats['queue_depth_sum'] / frames:.1f} max {stats['max_queue_depth']}"
+    )
@@ -0,0 +1,102 @@
+from src.generate import (
+    plan_unique_attr,
+    render_images,
+    generate_images_from_attr_csv,
+    df_group,
+    sampler,
+    props,
+)
+import os
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+import pandas as pd
+
+
+# the project state and part hashes of the repo are left alone
+@mock.patch.multiple(
+    "src.generate",
+    save_layer_hashes=mock.DEFAULT,
+    mark_rendered=mock.DEFAULT,
+    record_tokens=mock.DEFAULT,
+    forget_uploads=mock.DEFAULT,
+    record_stage=mock.DEFAULT,
+)
+class TestAttr(unittest.TestCase):
+    def test_render_rows(self, **_):
+        with tempfile.TemporaryDirectory() as folder:
+            save_folder = os.path.join(folder, "images")
+            plan_path = os.path.join(folder, "plan.csv")
+            folder_idx, codes = plan_unique_attr(8, seed=2)
+            values = {
+                prop: np.array(sampler.values[p], dtype=object)[codes[:, p]]
+                for p, prop in enumerate(props)
+            }
+            names = ["-".join(row) for row in zip(*values.values())]
+            data = {
+                "path": [
+                    os.path.join(save_folder, f"{i}-{name}.jpg")
+                    for i, name in enumerate(names)
+                ]
+            } | values
+            data["folder"] = np.array(sampler.folders, dtype=object)[folder_idx]
+            pd.DataFrame(data).to_csv(plan_path, index=False)
+            os.makedirs(save_folder)
+            render_images(plan_path, save_folder, workers=1, chunk_size=4)
+            attr_path = os.path.join(save_folder, "attr.csv")
+
+            # change the last value of token 1
+            df = pd.read_csv(attr_path, dtype=str, keep_default_na=False)
+            prop, current = props[-1], df[props[-1]][1]
+            df.loc[1, prop] = next(
+                v
+                for f, p, v in df_group.index
+                if f == data["folder"][1] and p == prop and v != current
+            )
+            df.to_csv(attr_path, index=False)
+            mtime = os.path.getmtime(data["path"][0])
+            with mock.patch("src.generate.save_folder", save_folder):
+                self.assertRaisesRegex(
+                    ValueError,
+                    r"rows \[8\]",
+                    generate_images_from_attr_csv,
+                    attr_path,
+                    1,
+                    4,
+                    [8],
+                )
+                self.assertRaisesRegex(
+                    ValueError,
+                    r"tokens \['9'\]",
+                    generate_images_from_attr_csv,
+                    attr_path,
+                    1,
+                    4,
+                    None,
+                    ["9"],
+                )
+                self.assertEqual(
+                    generate_images_from_attr_csv(attr_path, 1, 4, token_ids=["1"]), 1
+                )
+            new_path = os.path.join(
+                save_folder, f"1-{'-'.join(df.loc[1, list(props)])}.jpg"
+            )
+            self.assertFalse(os.path.exists(data["path"][1]))
+            self.assertTrue(os.path.exists(new_path))
+            self.assertEqual(os.path.getmtime(data["path"][0]), mtime)
+            df_after = pd.read_csv(attr_path, dtype=str, keep_default_na=False)
+            self.assertEqual(df_after["path"][1], new_path)
+            self.assertEqual(list(df_after["path"][2:]), data["path"][2:])
+
+            # an empty csv renders nothing in full mode
+            empty_folder = os.path.join(folder, "empty")
+            os.makedirs(empty_folder)
+            empty_path = os.path.join(folder, "empty.csv")
+            df.iloc[:0].to_csv(empty_path, index=False)
+            with mock.patch("src.generate.save_folder", empty_folder):
+                self.assertEqual(generate_images_from_attr_csv(empty_path, 1, 4), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
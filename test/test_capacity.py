@@ -0,0 +1,27 @@
+from src.generate import sampler, rules
+from src.capacity import analyze_capacity
+import itertools
+import unittest
+import numpy as np
+
+
+class TestCapacity(unittest.TestCase):
+    def test_exact_count(self):
+        report = analyze_capacity(sampler, rules, 10)
+        for f, folder in enumerate(report["folders"]):
+            options = [
+                sampler.codes[f][p][sampler.weights[f][p] > 0]
+                for p in range(len(sampler.props))
+            ]
+            combos = np.array(list(itertools.product(*options)))
+            valid, codes = rules.apply(np.full(len(combos), f), combos)
+            self.assertEqual(folder["combinations"], len(set(map(tuple, codes[valid]))))
+            self.assertAlmostEqual(folder["accept"], valid.mean(), delta=0.05)
+
+    def test_over_capacity(self):
+        report = analyze_capacity(sampler, rules, 10**6)
+        self.assertEqual(report["draws"], float("inf"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,35 @@
+from src.journal import Journal, read_journal, is_complete_image
+import os
+import tempfile
+import unittest
+from PIL import Image
+
+
+class TestJournal(unittest.TestCase):
+    def test_partial_line(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "attr.csv")
+            with Journal(path, ["path", "a", "b"]) as journal:
+                journal.append([["1.jpg", "x", "y"], ["2.jpg", "x", "z"]])
+            with open(path, "a") as f:
+                f.write("3.jpg,x")  # cut by a crash
+            self.assertEqual(
+                read_journal(path, 3), [["1.jpg", "x", "y"], ["2.jpg", "x", "z"]]
+            )
+
+    def test_complete_image(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "1.jpg")
+            Image.new("RGB", (64, 64), (200, 10, 10)).save(path, "jpeg")
+            self.assertTrue(is_complete_image(path))
+            size = os.path.getsize(path)
+            with open(path, "r+b") as f:
+                f.truncate(size // 2)
+            self.assertFalse(is_complete_image(path))
+            open(path, "w").close()
+            self.assertFalse(is_complete_image(path))
+            self.assertFalse(is_complete_image(os.path.join(folder, "2.jpg")))
+
+
+if __name__ == "__main__":
+    unittest.main()
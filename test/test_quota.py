@@ -0,0 +1,33 @@
+from src.generate import df_pac, props, rule_df, sampler
+from src.sampler import CompiledSampler
+from src.rules import CompiledRules
+from src.quota import allocate_quotas, plan_quota
+import unittest
+import numpy as np
+
+
+class TestQuota(unittest.TestCase):
+    def test_exact_quotas(self):
+        one_folder = CompiledSampler(df_pac, props, sampler.folders, [1, 0])
+        rules = CompiledRules(rule_df, one_folder)
+        for amount in (100, 380):
+            folder_idx, codes, _ = plan_quota(
+                one_folder, rules, amount, np.random.default_rng(0)
+            )
+            folder_counts, value_counts = allocate_quotas(one_folder, rules, amount)
+            self.assertTrue(rules.satisfied(codes).all())
+            self.assertEqual(len({row.tobytes() for row in codes}), amount)
+            for p in range(len(props)):
+                counts = np.bincount(codes[:, p], minlength=len(one_folder.values[p]))
+                self.assertTrue(
+                    np.array_equal(counts[one_folder.codes[0][p]], value_counts[0][p])
+                )
+
+    def test_over_folder_capacity(self):
+        rules = CompiledRules(rule_df, sampler)
+        with self.assertRaises(ValueError):
+            plan_quota(sampler, rules, 50, np.random.default_rng(0))
+
+
+if __name__ == "__main__":
+    unittest.main()
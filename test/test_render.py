@@ -0,0 +1,83 @@
+from src.render import (
+    LayerCache,
+    PrefixCompositor,
+    load_pil_layer,
+    load_array_layer,
+    layer_nbytes,
+    composite_pil,
+    composite_numpy,
+    prefix_savings,
+)
+import unittest
+import numpy as np
+
+LAYERS = [
+    "parts/01_Background/blue.png",
+    "parts/02_First Letter/B.png",
+    "parts/03_Second Letter/A.png",
+]
+LAYER_BYTES = 400 * 400 * 4
+
+
+class TestLayerCache(unittest.TestCase):
+    def test_hits(self):
+        cache = LayerCache(LAYER_BYTES * 3)
+        cache.warm(LAYERS)
+        img, _, _ = cache.get(LAYERS[0])
+        self.assertEqual(img.mode, "RGBA")
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 3)
+
+    def test_lru_eviction(self):
+        sizes = [layer_nbytes(load_pil_layer(path)) for path in LAYERS]
+        cache = LayerCache(sizes[0] + max(sizes[1:]))
+        for path in LAYERS[:2] + LAYERS[:1] + LAYERS[2:]:
+            cache.get(path)
+        self.assertEqual(list(cache.layers), [LAYERS[0], LAYERS[2]])
+        self.assertEqual(cache.stats()["evictions"], 1)
+        self.assertEqual(cache.stats()["bytes"], sizes[0] + sizes[2])
+
+    def test_crop(self):
+        background, _, offset = load_pil_layer(LAYERS[0])
+        self.assertEqual((background.size, offset), ((400, 400), (0, 0)))
+        letter, _, offset = load_pil_layer(LAYERS[1])
+        self.assertLess(layer_nbytes((letter,)), LAYER_BYTES)
+        self.assertLessEqual(offset[0] + letter.width, 400)
+        self.assertLessEqual(offset[1] + letter.height, 400)
+
+
+class TestCompositor(unittest.TestCase):
+    def test_numpy_same_as_pil(self):
+        pil_cache = LayerCache(LAYER_BYTES * 8)
+        array_cache = LayerCache(LAYER_BYTES * 8, load_array_layer)
+        stacks = [
+            LAYERS,
+            LAYERS[1:],
+            ["parts2/01_Background/black.png", "parts2/02_First Letter/1.png"],
+        ]
+        for paths in stacks:
+            expected = np.asarray(composite_pil(paths, pil_cache))
+            actual = np.asarray(composite_numpy(paths, array_cache))
+            self.assertTrue((expected == actual).all())
+
+    def test_prefix_compositor(self):
+        pil_cache = LayerCache(LAYER_BYTES * 8)
+        array_cache = LayerCache(LAYER_BYTES * 8, load_array_layer)
+        stacks = [
+            LAYERS,
+            LAYERS[:2] + ["parts/03_Second Letter/Q.png"],
+            LAYERS[:1]
+            + ["parts/02_First Letter/C.png", "parts/03_Second Letter/Q.png"],
+            ["parts/01_Background/red.png"] + LAYERS[1:],
+        ]
+        for compositor, cache in (("pil", pil_cache), ("numpy", array_cache)):
+            prefix = PrefixCompositor(LAYER_BYTES * 8, compositor, cache)
+            for paths in stacks:
+                expected = np.asarray(composite_pil(paths, pil_cache))
+                self.assertTrue((expected == np.asarray(prefix.composite(paths))).all())
+            self.assertEqual(prefix.saved, 3)
+            self.assertEqual(prefix_savings(stacks, prefix.max_depth), (12, 3))
+
+
+if __name__ == "__main__":
+    unittest.main()
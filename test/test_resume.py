@@ -0,0 +1,50 @@
+from src.generate import plan_unique_attr, render_images, sampler, props
+import os
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+import pandas as pd
+
+
+# the project state and part hashes of the repo are left alone
+@mock.patch.multiple(
+    "src.generate",
+    save_layer_hashes=mock.DEFAULT,
+    mark_rendered=mock.DEFAULT,
+    record_stage=mock.DEFAULT,
+)
+class TestResume(unittest.TestCase):
+    def test_resume_cut_journal(self, **_):
+        with tempfile.TemporaryDirectory() as folder:
+            save_folder = os.path.join(folder, "images")
+            plan_path = os.path.join(folder, "plan.csv")
+            folder_idx, codes = plan_unique_attr(12, seed=3)
+            data = {
+                "path": [os.path.join(save_folder, f"{i}.jpg") for i in range(12)]
+            } | {
+                prop: np.array(sampler.values[p], dtype=object)[codes[:, p]]
+                for p, prop in enumerate(props)
+            }
+            data["folder"] = np.array(sampler.folders, dtype=object)[folder_idx]
+            pd.DataFrame(data).to_csv(plan_path, index=False)
+            os.makedirs(save_folder)
+            render_images(plan_path, save_folder, workers=1, chunk_size=4)
+            attr_path = os.path.join(save_folder, "attr.csv")
+            with open(attr_path, "rb") as f:
+                rendered = f.read()
+
+            # a crash inside the last field of the journal and before an image was written
+            with open(attr_path, "wb") as f:
+                f.write(rendered[: rendered.rindex(b",") + 1])
+            os.remove(data["path"][0])
+            self.assertEqual(
+                render_images(plan_path, save_folder, 1, 4, resume=True), 2
+            )
+            with open(attr_path, "rb") as f:
+                self.assertEqual(f.read(), rendered)
+            self.assertTrue(all(os.path.exists(path) for path in data["path"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,8 @@
-from src.generate import apply_rules
+from src.generate import apply_rules, sampler, rules as compiled_rules
+from src.rules import CompiledRules
 import unittest
 import pandas as pd
+import numpy as np
 
 rule = pd.read_csv("rules.csv")
 
@@ -45,5 +47,31 @@ class TestRules(unittest.TestCase):
         self.assertEqual(random_attr1[0], True)
         self.assertEqual(random_attr1[1], old)
 
+    def test_batch_same_as_single(self):
+        folder_idx, codes = sampler.draw(200)
+        valid, new_codes = compiled_rules.apply(folder_idx, codes)
+        for i in range(len(codes)):
+            is_valid, attrs = apply_rules(sampler.decode(folder_idx[i], codes[i]), rule)
+            self.assertEqual(is_valid, valid[i])
+            if is_valid:
+                self.assertEqual(attrs, sampler.decode(folder_idx[i], new_codes[i]))
+
+    def test_invalid_rule_value(self):
+        bad = pd.DataFrame([{"prop": "Background", "value": "blue", "list_prop_value": "[('First Letter','Z')]", "rule": 1}])
+        with self.assertRaises(ValueError):
+            CompiledRules(bad, sampler)
+
+    def test_constrained(self):
+        strict = pd.DataFrame([
+            {"prop": "Background", "value": "blue", "list_prop_value": "[('First Letter','B')]", "rule": 1},
+            {"prop": "First Letter", "value": "B", "list_prop_value": "[('Background','blue')]", "rule": -1},
+            {"prop": "First Letter", "value": "C", "list_prop_value": "[('Second Letter','A'),('Second Letter','Q')]", "rule": -1},
+        ])
+        compiled = CompiledRules(strict, sampler)
+        self.assertEqual(compiled.find_unsatisfiable(), [("parts", "Background", "blue")])
+        folder_idx, codes, valid = compiled.draw_constrained(500)
+        self.assertTrue(compiled.check(codes[valid]).all())
+        self.assertGreater(valid.mean(), 0.8)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,59 @@
+from src.generate import (
+    sampler,
+    df_pac,
+    props,
+    random_attr,
+    plan_unique_attr,
+    infer_folders,
+)
+import unittest
+import numpy as np
+import pandas as pd
+
+
+class TestSampler(unittest.TestCase):
+    def test_draw_shape(self):
+        folder_idx, codes = sampler.draw(500)
+        self.assertEqual(folder_idx.shape, (500,))
+        self.assertEqual(codes.shape, (500, len(props)))
+
+    def test_draw_in_folder(self):
+        folder_idx, codes = sampler.draw(500)
+        for folder_index, row in zip(folder_idx, codes):
+            for attr in sampler.decode(folder_index, row):
+                self.assertIn(attr["value"], df_pac.index)
+
+    def test_distribution(self):
+        rng = np.random.default_rng(0)
+        folder_idx, _ = sampler.draw(20000, rng)
+        parts_ratio = np.mean(folder_idx == sampler.folders.index("parts"))
+        self.assertAlmostEqual(parts_ratio, 0.5, delta=0.02)
+
+    def test_encode_decode(self):
+        attributes = random_attr()
+        folder_index, codes = sampler.encode(attributes)
+        self.assertEqual(sampler.decode(folder_index, codes), attributes)
+
+    def test_seeded_plan(self):
+        folder_idx, codes = plan_unique_attr(30, seed=7, start_id=1)
+        # a token draws from the stream of its id, it doesn't depend on later tokens
+        first_idx, first_codes = plan_unique_attr(1, seed=7, start_id=1)
+        self.assertEqual(folder_idx[0], first_idx[0])
+        self.assertTrue(np.array_equal(codes[0], first_codes[0]))
+        again_idx, again_codes = plan_unique_attr(30, seed=7, start_id=1)
+        self.assertTrue(np.array_equal(folder_idx, again_idx))
+        self.assertTrue(np.array_equal(codes, again_codes))
+
+    def test_infer_folders(self):
+        attributes = random_attr()
+        row = {attr["trait_type"]: attr["value"][2] for attr in attributes}
+        df = infer_folders(pd.DataFrame([row]))
+        self.assertEqual(df["folder"][0], attributes[0]["value"][0])
+        # a value of another prop is reported like an unknown value
+        second = sampler.values[1][0]
+        with self.assertRaisesRegex(ValueError, f'row "0" & column "{props[0]}"'):
+            infer_folders(pd.DataFrame([row | {props[0]: second}]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+from src.generate import (
+    plan_unique_attr,
+    shard_plan,
+    render_images,
+    merge_shards,
+    sampler,
+    props,
+)
+import os
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+import pandas as pd
+
+
+def make_plan(amount: int, save_folder: str) -> pd.DataFrame:
+    folder_idx, codes = plan_unique_attr(amount, seed=1)
+    data = {"path": [os.path.join(save_folder, f"{i}.jpg") for i in range(amount)]} | {
+        prop: np.array(sampler.values[p], dtype=object)[codes[:, p]]
+        for p, prop in enumerate(props)
+    }
+    data["folder"] = np.array(sampler.folders, dtype=object)[folder_idx]
+    return pd.DataFrame(data)
+
+
+def read_images(folder: str) -> dict[str, bytes]:
+    images = {}
+    for name in os.listdir(folder):
+        with open(os.path.join(folder, name), "rb") as f:
+            images[name] = f.read()
+    return images
+
+
+class TestShard(unittest.TestCase):
+    def test_disjoint_cover(self):
+        df_plan = make_plan(50, "./images")
+        names = []
+        for i in range(3):
+            df_shard = shard_plan(df_plan, f"./images-shard-{i}-of-3", i, 3)
+            self.assertTrue(
+                all(p.startswith(f"./images-shard-{i}-of-3") for p in df_shard["path"])
+            )
+            names.extend(os.path.basename(p) for p in df_shard["path"])
+        self.assertEqual(sorted(names), sorted(f"{i}.jpg" for i in range(50)))
+        self.assertRaises(ValueError, shard_plan, df_plan, "./images", 3, 3)
+
+    # the project state and part hashes of the repo are left alone
+    @mock.patch.multiple(
+        "src.generate",
+        save_layer_hashes=mock.DEFAULT,
+        mark_rendered=mock.DEFAULT,
+        record_stage=mock.DEFAULT,
+    )
+    def test_merge_same_as_unsharded(self, **_):
+        with tempfile.TemporaryDirectory() as folder:
+            save_folder = os.path.join(folder, "images")
+            plan_path = os.path.join(folder, "plan.csv")
+            make_plan(12, save_folder).to_csv(plan_path, index=False)
+            os.makedirs(save_folder)
+            render_images(plan_path, save_folder, workers=1, chunk_size=4)
+            unsharded = read_images(save_folder)
+            os.rename(save_folder, os.path.join(folder, "unsharded"))
+
+            for i in range(3):
+                render_images(plan_path, save_folder, 1, 4, shard=(i, 3))
+            self.assertEqual(merge_shards(plan_path, save_folder), 12)
+            self.assertEqual(read_images(save_folder), unsharded)
+            self.assertEqual(
+                sorted(os.listdir(folder)), ["images", "plan.csv", "unsharded"]
+            )
+
+            # merging again would mix two runs in one folder
+            self.assertRaises(AssertionError, merge_shards, plan_path, save_folder)
+
+
+if __name__ == "__main__":
+    unittest.main()
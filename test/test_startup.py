@@ -0,0 +1,12 @@
+from src.benchmark import benchmark_startup
+import unittest
+
+
+class TestStartup(unittest.TestCase):
+    def test_upload_imports_light(self):
+        for result in benchmark_startup(["upload", "upload_mystery_box"], repeat=1):
+            self.assertEqual(result["heavy"], "", result["module"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+from src.state import (
+    record_parts,
+    read_parts,
+    record_hashes,
+    record_tokens,
+    mark_rendered,
+    record_uploads,
+    forget_uploads,
+    read_uploads,
+    drop_tokens,
+    pending_uploads,
+    record_stage,
+    read_status,
+)
+import json
+import os
+import tempfile
+import unittest
+
+
+class TestState(unittest.TestCase):
+    def test_progress(self):
+        with tempfile.TemporaryDirectory() as folder:
+            state_path = os.path.join(folder, "state.db")
+            self.assertIsNone(pending_uploads(state_path))
+
+            part = os.path.join("parts", "01_Background", "white.png")
+            facts = {"size": 10, "mtime": 1, "error": None}
+            self.assertIsNone(read_parts(["parts"], state_path))
+            record_parts({part: facts}, state_path)
+            self.assertEqual(read_parts(["parts"], state_path), [part])
+            self.assertIsNone(read_parts(["parts", "parts2"], state_path))
+            record_hashes({part: "ab"}, state_path)
+            record_parts({part: facts}, state_path)
+            self.assertEqual(read_status(state_path)["hashed"], 1)
+            record_parts({part: facts | {"mtime": 2}}, state_path)
+            self.assertEqual(read_status(state_path)["hashed"], 0)
+
+            paths = [os.path.join(folder, f"{i}-red-A.jpg") for i in (2, 1, 3)]
+            for path in paths:
+                open(path, "w").close()
+            record_tokens(
+                [(p, "parts", ["red", "A"]) for p in paths], False, state_path
+            )
+            self.assertEqual(pending_uploads(state_path), None)
+            mark_rendered(paths[:2], state_path)
+            self.assertEqual(
+                pending_uploads(state_path), ["1-red-A.jpg", "2-red-A.jpg"]
+            )
+            infos = [
+                {"Name": "1-red-A.jpg", "Hash": "Qm1", "Size": "1"},
+                {"Name": "2-red-A.jpg", "Hash": "Qm2", "Size": "1"},
+            ]
+            record_uploads(infos[:1], state_path)
+            self.assertEqual(pending_uploads(state_path), ["2-red-A.jpg"])
+            self.assertEqual(read_uploads(state_path), infos[:1])
+            # a forgotten CID is dropped from the backup, reading it can't restore it
+            backup_path = os.path.join(folder, "backup.json")
+            with open(backup_path, "w") as f:
+                json.dump(infos + [None], f)
+            forget_uploads(["1-red-A.jpg"], state_path, backup_path)
+            self.assertEqual(len(pending_uploads(state_path)), 2)
+            with open(backup_path) as f:
+                self.assertEqual(json.load(f), infos[1:] + [None])
+            # deleted images are never pending
+            os.remove(paths[0])
+            self.assertEqual(pending_uploads(state_path), ["1-red-A.jpg"])
+            drop_tokens(paths[:1], state_path)
+
+            record_stage("plan", "3 tokens", state_path)
+            status = read_status(state_path)
+            self.assertEqual(
+                [status[key] for key in ["parts", "planned", "rendered", "uploaded"]],
+                [1, 2, 1, 0],
+            )
+            self.assertEqual(status["stages"]["plan"][1], "3 tokens")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+from src.storage import read_table, write_table, load_pyarrow
+from src.rules import parse_prop_values
+import os
+import tempfile
+import unittest
+import pandas as pd
+
+
+class TestStorage(unittest.TestCase):
+    def test_csv_only(self):
+        with tempfile.TemporaryDirectory() as folder:
+            csv_path = os.path.join(folder, "rules.csv")
+            pd.DataFrame(
+                {"prop": ["Background"], "list_prop_value": ["[('Letter','B')]"]}
+            ).to_csv(csv_path, index=False)
+            df = read_table(
+                csv_path,
+                categories=["prop", "missing"],
+                parsers={"list_prop_value": parse_prop_values},
+                arrow_folder=None,
+            )
+            self.assertEqual(df["prop"].dtype, "category")
+            self.assertEqual(df["list_prop_value"][0], "[('Letter','B')]")
+
+    @unittest.skipUnless(load_pyarrow("tables"), "pyarrow is not installed")
+    def test_arrow_copy(self):
+        with tempfile.TemporaryDirectory() as folder:
+            csv_path = os.path.join(folder, "attr.csv")
+            arrow_folder = os.path.join(folder, "tables")
+            df = pd.DataFrame({"path": ["1-a.jpg", "2-b.jpg"], "Letter": ["a", "b"]})
+            write_table(df, csv_path, ["Letter"], arrow_folder, dtype=str)
+            self.assertEqual(len(os.listdir(arrow_folder)), 1)
+            cached = read_table(
+                csv_path, ["Letter"], arrow_folder=arrow_folder, dtype=str
+            )
+            self.assertEqual(cached["Letter"].dtype, "category")
+            self.assertEqual(list(cached["Letter"]), ["a", "b"])
+
+            # a reader with other options gets its own parse, not the copy
+            plain = read_table(csv_path, arrow_folder=arrow_folder)
+            self.assertEqual(plain["Letter"].dtype, object)
+            cached = read_table(csv_path, ["Letter"], arrow_folder=arrow_folder)
+            self.assertEqual(cached["Letter"].dtype, "category")
+
+            # a csv outside the project of the copies gets none
+            with tempfile.TemporaryDirectory() as other:
+                other_folder = os.path.join(other, "tables")
+                read_table(csv_path, ["Letter"], arrow_folder=other_folder)
+                self.assertFalse(os.path.exists(other_folder))
+
+            # an edited csv is parsed again
+            df.assign(Letter=["c", "dd"]).to_csv(csv_path, index=False)
+            edited = read_table(csv_path, arrow_folder=arrow_folder)
+            self.assertEqual(list(edited["Letter"]), ["c", "dd"])
+
+            # parsed cells come back from the copy, bad ones keep the csv text
+            rules_path = os.path.join(folder, "rules.csv")
+            for text, expected in [
+                ("[('Letter','B'),('Number',1)]", [["Letter", "B"], ["Number", "1"]]),
+                ("[('Letter'", "[('Letter'"),
+            ]:
+                pd.DataFrame({"list_prop_value": [text]}).to_csv(
+                    rules_path, index=False
+                )
+                for _ in range(2):
+                    cell = read_table(
+                        rules_path,
+                        parsers={"list_prop_value": parse_prop_values},
+                        arrow_folder=arrow_folder,
+                    )["list_prop_value"][0]
+                    if not isinstance(cell, str):
+                        cell = [list(pair) for pair in cell]
+                    self.assertEqual(cell, expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
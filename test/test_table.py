@@ -0,0 +1,30 @@
+from src.get_table import build_layer_index
+import os
+import unittest
+
+
+class TestLayerIndex(unittest.TestCase):
+    def test_index(self):
+        files_path = [
+            os.path.join("parts", "01_Background", "blue.png"),
+            os.path.join("parts", "01_Background", "notes.txt"),
+            os.path.join("parts", "02_Letter", "A.PNG"),
+        ]
+        layer_index, layer_order = build_layer_index(files_path)
+        self.assertEqual(
+            layer_index,
+            {
+                ("parts", "Background", "blue"): files_path[0],
+                ("parts", "Letter", "A"): files_path[2],
+            },
+        )
+        self.assertEqual(layer_order, ["01_Background", "02_Letter"])
+        # two files of one value would draw either of them
+        with self.assertRaises(ValueError):
+            build_layer_index(
+                files_path + [os.path.join("parts", "02_Letter", "A.png")]
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
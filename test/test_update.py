@@ -0,0 +1,86 @@
+from src.generate import (
+    plan_unique_attr,
+    render_images,
+    update_images,
+    token_layers,
+    layer_paths,
+    read_plan,
+    part_layers,
+    hash_files,
+    sampler,
+    props,
+)
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+import pandas as pd
+
+
+# the project state and part hashes of the repo are left alone
+@mock.patch.multiple(
+    "src.generate",
+    record_hashes=mock.DEFAULT,
+    mark_rendered=mock.DEFAULT,
+    forget_uploads=mock.DEFAULT,
+    record_stage=mock.DEFAULT,
+)
+class TestUpdate(unittest.TestCase):
+    def test_update(self, **_):
+        with tempfile.TemporaryDirectory() as folder:
+            save_folder = os.path.join(folder, "images")
+            plan_path = os.path.join(folder, "plan.csv")
+            hashes_path = os.path.join(folder, "hashes.json")
+            folder_idx, codes = plan_unique_attr(12, seed=5)
+            data = {
+                "path": [os.path.join(save_folder, f"{i}-t.jpg") for i in range(12)]
+            } | {
+                prop: np.array(sampler.values[p], dtype=object)[codes[:, p]]
+                for p, prop in enumerate(props)
+            }
+            data["folder"] = np.array(sampler.folders, dtype=object)[folder_idx]
+            pd.DataFrame(data).to_csv(plan_path, index=False)
+            os.makedirs(save_folder)
+            with mock.patch("src.generate.save_layer_hashes"):
+                render_images(plan_path, save_folder, workers=1, chunk_size=4)
+            attr_path = os.path.join(save_folder, "attr.csv")
+            df_attr = read_plan(attr_path)
+            with open(hashes_path, "w") as f:
+                json.dump(hash_files(layer_paths(df_attr)), f)
+
+            # unchanged part files render nothing
+            self.assertEqual(update_images(attr_path, hashes_path, 1, 4), [])
+
+            # a changed hash re-renders the tokens using that file only
+            changed = layer_paths(df_attr)[-1]
+            with open(hashes_path, "w") as f:
+                json.dump(hash_files(layer_paths(df_attr)) | {changed: "old"}, f)
+            expected = [
+                str(i)
+                for i, paths in enumerate(token_layers(df_attr))
+                if changed in paths
+            ]
+            mtime = os.path.getmtime(data["path"][int(expected[0])])
+            os.utime(data["path"][int(expected[0])], (mtime - 10, mtime - 10))
+            self.assertEqual(
+                sorted(update_images(attr_path, hashes_path, 1, 4), key=int), expected
+            )
+            self.assertGreater(
+                os.path.getmtime(data["path"][int(expected[0])]), mtime - 10
+            )
+            with open(hashes_path) as f:
+                self.assertNotEqual(json.load(f)[changed], "old")
+
+            # a deleted file is reported with its tokens before anything is rendered
+            layer_index = part_layers()[1]
+            key = next(k for k, path in layer_index.items() if path == changed)
+            gone = os.path.join(folder, "gone.png")
+            with mock.patch.dict(layer_index, {key: gone}):
+                with self.assertRaisesRegex(ValueError, " ".join(expected)):
+                    update_images(attr_path, hashes_path, 1, 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+from src.validate import validate_layers, read_layer_facts, inspect_layer
+from src.config import W, H
+import json
+import os
+import tempfile
+import unittest
+from PIL import Image
+
+
+class TestValidate(unittest.TestCase):
+    def test_facts_and_cache(self):
+        with tempfile.TemporaryDirectory() as folder:
+            paths = [os.path.join(folder, f"{name}.png") for name in "abcd"]
+            layer = Image.new("RGBA", (W, H), (0, 0, 0, 0))
+            layer.paste((255, 0, 0, 128), (10, 20, 30, 40))
+            layer.save(paths[0])
+            Image.new("RGB", (W, H), (0, 0, 255)).save(paths[1])
+            Image.new("1", (W, H)).save(paths[2])
+            layer.save(paths[3])
+            with open(paths[3], "r+b") as f:
+                f.truncate(os.path.getsize(paths[3]) // 2)
+            facts_path = os.path.join(folder, "facts.json")
+
+            facts = validate_layers(paths, facts_path, workers=2)
+            self.assertIsNone(facts[paths[0]]["error"])
+            self.assertTrue(facts[paths[0]]["transparent"])
+            self.assertEqual(facts[paths[0]]["bbox"], [10, 20, 30, 40])
+            self.assertTrue(facts[paths[1]]["opaque"])
+            self.assertFalse(facts[paths[1]]["transparent"])
+            self.assertIn("mode", facts[paths[2]]["error"])
+            self.assertIn("corrupted", facts[paths[3]]["error"])
+
+            # unchanged files are taken from the sidecar, touched ones checked again
+            cached = read_layer_facts(facts_path)
+            cached[paths[0]]["bbox"] = cached[paths[1]]["bbox"] = "cached"
+            with open(facts_path, "w") as f:
+                json.dump(cached, f)
+            stat = os.stat(paths[1])
+            os.utime(paths[1], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+            facts = validate_layers(paths, facts_path, workers=1)
+            self.assertEqual(facts[paths[0]]["bbox"], "cached")
+            self.assertEqual(facts[paths[1]]["bbox"], [0, 0, W, H])
+
+    def test_decompression_bomb(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "a.png")
+            Image.new("RGBA", (W, H)).save(path)
+            max_pixels = Image.MAX_IMAGE_PIXELS
+            Image.MAX_IMAGE_PIXELS = W * H // 4
+            try:
+                self.assertIn("corrupted", inspect_layer(path)["error"])
+            finally:
+                Image.MAX_IMAGE_PIXELS = max_pixels
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,25 @@
+from src.writer import ImageWriter
+import os
+import tempfile
+import unittest
+from PIL import Image
+
+
+class TestImageWriter(unittest.TestCase):
+    def test_write(self):
+        with tempfile.TemporaryDirectory() as folder:
+            for threads in (0, 2):
+                writer = ImageWriter(threads, queue_size=2)
+                paths = [os.path.join(folder, f"{threads}-{i}.png") for i in range(10)]
+                for i, path in enumerate(paths):
+                    writer.submit(Image.new("RGB", (40, 40), (i, 0, 0)), path)
+                stats = writer.close()
+                self.assertEqual(stats["frames"], 10)
+                for path in paths:
+                    with Image.open(path) as img:
+                        self.assertEqual(img.format, "JPEG")
+                        self.assertEqual(img.size, (40, 40))
+
+
+if __name__ == "__main__":
+    unittest.main()